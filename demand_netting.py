@@ -16,15 +16,94 @@
         v24.5
             - Added Profiling & Skip Netting
             - Fix multistream calculation for consumption by multiple forecasts.
+        v24.6
+            - Array-backed netting kernel (Use Array Netting Kernel).
+            - Integer-coded dimension keys (Use Encoded Dimension Keys).
+            - Constant time backward/forward bucket windows.
+            - Memory bounded consumption tuple cache (Consumption Tuple Cache Size (MB)).
+            - Lazily generated consumption tuples (Use Lazy Consumption Tuples), hash loop only.
+            - Parallel netting of independent consumption components (Netting Parallel Workers).
+            - Persisted netting state and incremental re-netting (Netting State Directory, Incremental Netting).
+              Only the netting kernel work of unchanged components is reused; every other stage runs in full.
+            - Stage checkpoints and resume (Netting Checkpoint Directory, Resume From Checkpoint).
+            - Vectorized hierarchy maps with CSR child lists (HierarchyIndex).
+            - Memoized sibling lists, filtered by forecast/RTF presence.
+            - Consumption orders compiled once into a ConsumptionPlan.
+            - Association graph compiled to CSR adjacency with time sorted forecast windows.
+            - Columnar pegging recorder.
+            - Pegging sink writing sequenced pegging chunks to disk during netting (Pegging Sink Directory,
+              Pegging Sink Chunk Rows).
+            - Pegging aggregated per order and forecast key within a pass (Pegging Granularity).
+            - Pegging index for Demand ID and forecast key queries (PeggingIndex, Pegging Index Directory).
+            - Multistream forecast passes over per order type positions with a streams x rows state.
+            - Demand type split computed for all streams at once and concatenated once.
+            - Array based COM/NEW cascade over the forecast streams of an order stream in divide_demand.
+            - Remaining forecast appended to the RTF orders from positions, without renamed stream copies.
+            - RTF netting on the array kernel, reusing the tuple cache, forecast lookup builder and time
+              priority table of the forecast phase.
+            - Order priority sorted with lexsort over integer codes, string code tables cached.
+            - Vectorized native consumption for whole quantities, loop kept for the other cases.
+            - Orders alone on a single candidate forecast settled with cumulative sums before the kernel.
+            - Vectorized basis spread in Profiling (Distribute, Round Up, Round Down and proportional).
 """
 
-from pandas import DataFrame, to_datetime, merge, Series, concat, isna
-from collections import defaultdict
-from numpy import arange, vectorize, where, ceil, floor
+from pandas import (
+    DataFrame,
+    Index,
+    to_datetime,
+    merge,
+    Series,
+    concat,
+    isna,
+    factorize,
+    MultiIndex,
+    read_parquet,
+    read_pickle,
+)
+from collections import defaultdict, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import blake2b
+from heapq import heapify, heapreplace
+import os
+import pickle
+from numpy import (
+    arange,
+    vectorize,
+    where,
+    ceil,
+    floor,
+    array,
+    flatnonzero,
+    int32,
+    int64,
+    unique,
+    concatenate,
+    empty,
+    bincount,
+    ones_like,
+    zeros,
+    fmin,
+    full,
+    lexsort,
+    minimum,
+    maximum,
+    isfinite,
+    float64,
+)
+from sys import getsizeof
 from time import time
-from itertools import permutations
+from itertools import product
+from operator import itemgetter
 import datetime
 from pandas.tseries.offsets import DateOffset
+from pandas.util import hash_pandas_object
+
+try:
+    import pyarrow  # noqa: F401
+
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
 
 
 class PluginException(Exception):
@@ -86,6 +165,20 @@ class Config:
     DN_ENABLE_BACKWARD_BEFORE_CURRENT: str = "Reverse Time Backward Consumption Order"
     DN_ORDER_HORIZON: str = "Order Horizon"
     DN_ORDER_DUE_DATE: str = "Netting Order Due Date"
+    DN_ARRAY_KERNEL: str = "Use Array Netting Kernel"
+    DN_ENCODE_DIMENSIONS: str = "Use Encoded Dimension Keys"
+    DN_TUPLE_CACHE_SIZE: str = "Consumption Tuple Cache Size (MB)"
+    DN_LAZY_TUPLES: str = "Use Lazy Consumption Tuples"
+    DN_NETTING_WORKERS: str = "Netting Parallel Workers"
+    DN_STATE_DIRECTORY: str = "Netting State Directory"
+    # Inputs are a change set on the stored inputs; only kernel results of unchanged components are reused.
+    DN_INCREMENTAL_NETTING: str = "Incremental Netting"
+    DN_CHECKPOINT_DIRECTORY: str = "Netting Checkpoint Directory"
+    DN_RESUME_FROM_CHECKPOINT: str = "Resume From Checkpoint"
+    DN_PEGGING_SINK_DIRECTORY: str = "Pegging Sink Directory"
+    DN_PEGGING_SINK_CHUNK_ROWS: str = "Pegging Sink Chunk Rows"
+    DN_PEGGING_GRANULARITY: str = "Pegging Granularity"
+    DN_PEGGING_INDEX_DIRECTORY: str = "Pegging Index Directory"
     # Default Values
     USE_MULTI_STREAM: str = "0"
     USE_MAPPING: str = "0"
@@ -96,6 +189,19 @@ class Config:
     SKIP_NETTING: str = "0"
     OUT_AGGREGATE_GRAIN: str = "0"
     ENABLE_BACKWARD_BEFORE_CURRENT: str = "0"
+    ARRAY_KERNEL: str = "0"
+    ENCODE_DIMENSIONS: str = "0"
+    TUPLE_CACHE_SIZE: str = "0"
+    LAZY_TUPLES: str = "0"
+    NETTING_WORKERS: str = "1"
+    STATE_DIRECTORY: str = ""
+    INCREMENTAL_NETTING: str = "0"
+    CHECKPOINT_DIRECTORY: str = ""
+    RESUME_FROM_CHECKPOINT: str = "0"
+    PEGGING_SINK_DIRECTORY: str = ""
+    PEGGING_SINK_CHUNK_ROWS: str = "1000000"
+    PEGGING_GRANULARITY: str = "Consumption"
+    PEGGING_INDEX_DIRECTORY: str = ""
     VERSION: str = "Version.[Version Name]"
     DEMAND_TYPE: str = "Demand Type.[Demand Type]"
     DEMAND_ID: str = "Demand.[DemandID]"
@@ -143,6 +249,851 @@ class Config:
     ORDER_DUE_DATE = "Order Due Date"
 
 
+class ConsumptionTupleCache:
+    """
+    Consumption tuples keyed by (item, location, customer, time, backward, forward), along with the
+    resolved candidate forecast positions of the array kernel under the same keys.
+    With a budget (MB) the least recently used entries are evicted, together with their candidate
+    arrays, once the estimated size of the cached lists, candidate arrays and recipes exceeds it.
+    A recipe is a (source, row position) pair into a copy of the key columns of the frame the entry
+    was built from, so DemandNetting can regenerate an evicted entry. Recipes and sources are the
+    part of the size the budget can not reclaim. A budget of 0 keeps every entry.
+    """
+
+    TUPLE_SIZE: int = getsizeof(("", "", "", ""))
+
+    def __init__(self, _budgetMB: int = 0):
+        self.budget: int = max(int(_budgetMB), 0) * 1024 * 1024
+        self.entries: OrderedDict = OrderedDict()
+        self.sizes: dict = {}
+        self.recipes: dict = {}
+        self.sources: list = []
+        self.candidates: OrderedDict = OrderedDict()
+        self.used: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.regenerations: int = 0
+
+    def __contains__(self, _key) -> bool:
+        return _key in self.entries or _key in self.recipes
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def add(self, _key, _tuples, _recipe=None):
+        self.entries[_key] = _tuples
+        if isinstance(_tuples, LazyConsumptionTuples):
+            size = _tuples.nbytes()
+        else:
+            size = getsizeof(_tuples) + len(_tuples) * self.TUPLE_SIZE
+        self.used += size - self.sizes.get(_key, 0)
+        self.sizes[_key] = size
+        if self.budget > 0:
+            if _key not in self.recipes:
+                self.used += getsizeof(_recipe) + (
+                    getsizeof(_recipe[1]) if _recipe is not None else 0
+                )
+            self.recipes[_key] = _recipe
+            self.evict()
+
+    def add_source(self, _columns: dict, _levelColumns) -> int:
+        self.sources.append((_columns, _levelColumns))
+        self.used += sum(getsizeof(values) for values in _columns.values())
+        return len(self.sources) - 1
+
+    def recipe_row(self, _recipe):
+        """Row values and levels of a recipe, as the row dict its entry was first built from held them."""
+        columns, levelColumns = self.sources[_recipe[0]]
+        position = _recipe[1]
+        data = {column: values[position] for column, values in columns.items()}
+        levels = None
+        if levelColumns is not None:
+            levels = tuple(int(data[column]) for column in levelColumns)
+        return data, levels
+
+    def get(self, _key, _default=None):
+        tuples = self.entries.get(_key, None)
+        if tuples is None:
+            self.misses += 1
+            return _default
+        self.hits += 1
+        if self.budget > 0:
+            self.entries.move_to_end(_key)
+        return tuples
+
+    def get_candidates(self, _key):
+        candidates = self.candidates.get(_key, None)
+        if candidates is not None and self.budget > 0:
+            self.candidates.move_to_end(_key)
+        return candidates
+
+    def add_candidates(self, _key, _candidates):
+        self.candidates[_key] = _candidates
+        self.used += getsizeof(_candidates)
+        if self.budget > 0:
+            self.evict()
+
+    def clear_candidates(self):
+        for candidates in self.candidates.values():
+            self.used -= getsizeof(candidates)
+        self.candidates = OrderedDict()
+
+    def evict(self):
+        # The most recent entry and candidate array are always kept, even when they alone exceed the
+        # budget.
+        while self.used > self.budget and (len(self.entries) > 1 or len(self.candidates) > 1):
+            if len(self.entries) > 1:
+                key, _ = self.entries.popitem(last=False)
+                self.used -= self.sizes.pop(key)
+                self.evictions += 1
+                candidates = self.candidates.pop(key, None)
+            else:
+                _, candidates = self.candidates.popitem(last=False)
+            if candidates is not None:
+                self.used -= getsizeof(candidates)
+
+
+class PeggingRecorder:
+    """
+    Pegging rows as growable typed arrays: order, forecast, consumed quantity and segment (one per
+    netting pass). Rows are recorded with order index labels (or row positions) and forecast index
+    labels. Closing a segment turns them into row positions of the order and forecast frames of that
+    pass and keeps references to their key columns, to_frame() resolves the keys with one take per
+    segment and column. With _aggregate the rows of a segment are summed per order row and forecast
+    key when it closes, keeping the first forecast row of the key and the order of first consumption.
+    """
+
+    def __init__(self, _capacity: int = 1024, _aggregate: bool = False):
+        self.order_rows = empty(_capacity, dtype=int64)
+        self.forecast_rows = empty(_capacity, dtype=int64)
+        self.quantities = empty(_capacity, dtype=float)
+        self.size: int = 0
+        self.segment_start: int = 0
+        self.order_labels: bool = False
+        self.aggregate: bool = _aggregate
+        # (start, end, order key columns, forecast key columns, forecast measure) per closed segment.
+        self.segments: list = []
+
+    def reserve(self, _count: int):
+        required = self.size + _count
+        capacity = len(self.quantities)
+        if required <= capacity:
+            return
+        capacity = max(required, 2 * capacity)
+        for name in ("order_rows", "forecast_rows", "quantities"):
+            current = getattr(self, name)
+            grown = empty(capacity, dtype=current.dtype)
+            grown[: self.size] = current[: self.size]
+            setattr(self, name, grown)
+
+    def record(self, _orderLabel, _forecastLabel, _quantity):
+        if self.size == len(self.quantities):
+            self.reserve(1)
+        self.order_rows[self.size] = _orderLabel
+        self.forecast_rows[self.size] = _forecastLabel
+        self.quantities[self.size] = _quantity
+        self.size += 1
+        self.order_labels = True
+
+    def record_positions(self, _orderPositions, _forecastLabels, _quantities):
+        count = len(_quantities)
+        self.reserve(count)
+        rows = slice(self.size, self.size + count)
+        self.order_rows[rows] = _orderPositions
+        self.forecast_rows[rows] = _forecastLabels
+        self.quantities[rows] = _quantities
+        self.size += count
+
+    def discard_segment(self):
+        self.size = self.segment_start
+        self.order_labels = False
+
+    def clear(self):
+        self.size = 0
+        self.segment_start = 0
+        self.order_labels = False
+        self.segments = []
+
+    def close_segment(
+            self,
+            _orderIndex: Index,
+            _orderKeys: list,
+            _forecastIndex: Index,
+            _forecastKeys: list,
+            _forecastMeasure: str,
+    ):
+        rows = slice(self.segment_start, self.size)
+        if self.order_labels:
+            self.order_rows[rows] = _orderIndex.get_indexer(self.order_rows[rows])
+        self.forecast_rows[rows] = _forecastIndex.get_indexer(self.forecast_rows[rows])
+        if self.aggregate and self.size > self.segment_start:
+            self.aggregate_segment(_forecastKeys)
+        self.segments.append(
+            (self.segment_start, self.size, _orderKeys, _forecastKeys, _forecastMeasure)
+        )
+        self.segment_start = self.size
+        self.order_labels = False
+
+    def aggregate_segment(self, _forecastKeys: list):
+        rows = slice(self.segment_start, self.size)
+        keyCodes, _ = factorize(MultiIndex.from_arrays(_forecastKeys), use_na_sentinel=False)
+        # First forecast row of every key, -1 (not found) stays -1.
+        firstRow = empty(len(keyCodes) + 1, dtype=int64)
+        firstRow[-1] = -1
+        keyFirstRow = empty(keyCodes.max() + 1 if len(keyCodes) else 0, dtype=int64)
+        keyFirstRow[keyCodes[::-1]] = arange(len(keyCodes) - 1, -1, -1)
+        firstRow[:-1] = keyFirstRow[keyCodes]
+        forecastRows = firstRow[self.forecast_rows[rows]]
+        orderRows = self.order_rows[rows]
+        pairCodes, pairs = factorize(orderRows * (len(keyCodes) + 1) + forecastRows + 1)
+        count = len(pairs)
+        end = self.segment_start + count
+        self.quantities[self.segment_start: end] = bincount(
+            pairCodes, weights=self.quantities[rows], minlength=count
+        )
+        pairRows = pairs // (len(keyCodes) + 1)
+        self.forecast_rows[self.segment_start: end] = pairs - pairRows * (len(keyCodes) + 1) - 1
+        self.order_rows[self.segment_start: end] = pairRows
+        self.size = end
+
+    @staticmethod
+    def take(_values, _rows):
+        values = _values.take(_rows)
+        missing = _rows < 0
+        if missing.any():
+            values = values.astype(object)
+            values[missing] = None
+        return values
+
+    def to_frame(
+            self, _orderColumns: list, _forecastColumns: list, _measureColumn: str, _qtyColumn: str
+    ) -> DataFrame:
+        segments = [segment for segment in self.segments if segment[1] > segment[0]]
+        if not segments:
+            return DataFrame()
+        data = {}
+        for columns, rowSource, keyPosition in (
+                (_orderColumns, self.order_rows, 2),
+                (_forecastColumns, self.forecast_rows, 3),
+        ):
+            for columnPosition, column in enumerate(columns):
+                data[column] = concatenate(
+                    [
+                        self.take(segment[keyPosition][columnPosition], rowSource[segment[0]: segment[1]])
+                        for segment in segments
+                    ]
+                )
+        data[_measureColumn] = concatenate(
+            [array([segment[4]] * (segment[1] - segment[0]), dtype=object) for segment in segments]
+        )
+        data[_qtyColumn] = concatenate(
+            [self.quantities[segment[0]: segment[1]] for segment in segments]
+        )
+        return DataFrame(data)
+
+
+class PeggingSink:
+    """
+    Writes pegging to numbered chunk files (pegging_00000.parquet, ... of at most _chunkRows rows) while
+    netting runs, instead of keeping it for the returned output. Sequence ids continue across chunks
+    through a running count per pegging key, so every chunk is final when written. The pegging rows are
+    bounded by _chunkRows, the running counts are not: they hold one entry per distinct pegging key of
+    the run.
+    """
+
+    FILE_PREFIX: str = "pegging_"
+
+    def __init__(self, _directory: str, _chunkRows: int):
+        self.directory: str = _directory
+        self.chunk_rows: int = _chunkRows
+        self.files = NettingCheckpoint(_directory)
+        self.sequence_counts: dict = {}
+        self.chunk_files: list = []
+        self.rows: int = 0
+
+    def sequence(self, _pegging: DataFrame, _keyColumns: list):
+        """Sequence ids (1 based) of the rows per pegging key, following the rows already written."""
+        groups = _pegging.groupby(by=_keyColumns, sort=False)
+        groupCodes = groups.ngroup().to_numpy()
+        groupSizes = groups.size()
+        offsets = array(
+            [self.sequence_counts.get(key, 0) for key in groupSizes.index], dtype=int64
+        )
+        for key, size in zip(groupSizes.index, groupSizes.to_numpy()):
+            self.sequence_counts[key] = self.sequence_counts.get(key, 0) + int(size)
+        return groups.cumcount().to_numpy() + 1 + offsets[groupCodes]
+
+    def write(self, _pegging: DataFrame):
+        os.makedirs(self.directory, exist_ok=True)
+        for start in range(0, len(_pegging), self.chunk_rows):
+            chunk = _pegging.iloc[start: start + self.chunk_rows].reset_index(drop=True)
+            self.chunk_files.append(
+                self.files.write_frame(f"{self.FILE_PREFIX}{len(self.chunk_files):05d}", chunk)
+            )
+            self.rows += len(chunk)
+
+    def close(self):
+        """Remove chunk files of earlier runs that are not part of this one."""
+        if not os.path.isdir(self.directory):
+            return
+        current = set(self.chunk_files)
+        for fileName in os.listdir(self.directory):
+            if fileName.startswith(self.FILE_PREFIX) and fileName not in current:
+                os.remove(os.path.join(self.directory, fileName))
+
+    def read(self) -> DataFrame:
+        if not self.chunk_files:
+            return DataFrame()
+        return concat(
+            [self.files.read_frame(fileName) for fileName in self.chunk_files], ignore_index=True
+        )
+
+
+class ConsumptionPlan:
+    """
+    Backward Forward Consumption Order (BILSF) or Hierarchical Consumption Order (ILST), validated and
+    compiled once. Every segment (backward then forward, or the single hierarchical one) is stored as
+    the data_map keys in loop nest order, outermost first, and a getter that arranges one product
+    element as an (item, location, customer, time) tuple. Tuples repeated within a segment are
+    dropped, keeping the first.
+    """
+
+    def __init__(self, _consumptionOrder, _hierarchical: bool):
+        self.hierarchical: bool = _hierarchical
+        if _hierarchical:
+            if not (
+                    isinstance(_consumptionOrder, str)
+                    and len(_consumptionOrder) == 4
+                    and set(_consumptionOrder) == set("ILST")
+            ):
+                raise PluginException(
+                    f"Incorrect {Config.DN_H_CONSUMPTION_ORDER}: {_consumptionOrder}. Exiting!"
+                )
+            segmentOrders = [(_consumptionOrder, "T")]
+        else:
+            # Making sure Backward is done before Forward
+            if not (
+                    isinstance(_consumptionOrder, str)
+                    and len(_consumptionOrder) == 5
+                    and set(_consumptionOrder) == set("BILSF")
+                    and _consumptionOrder.index("B") < _consumptionOrder.index("F")
+            ):
+                raise PluginException(
+                    f"Incorrect {Config.DN_CONSUMPTION_ORDER}: {_consumptionOrder}. Exiting!"
+                )
+            segmentOrders = [
+                (_consumptionOrder.replace("F", ""), "B"),
+                (_consumptionOrder.replace("B", ""), "F"),
+            ]
+        self.segments: list = []
+        for consumptionOrder, timeKey in segmentOrders:
+            # The last character of a consumption order is the outermost loop.
+            loopKeys = consumptionOrder[::-1]
+            self.segments.append(
+                (
+                    loopKeys,
+                    itemgetter(
+                        loopKeys.index("I"),
+                        loopKeys.index("L"),
+                        loopKeys.index("S"),
+                        loopKeys.index(timeKey),
+                    ),
+                )
+            )
+
+    def form_tuples(self, _dataMap: dict) -> list:
+        result = []
+        for loopKeys, getter in self.segments:
+            result += dict.fromkeys(
+                map(getter, product(*[_dataMap[key] for key in loopKeys]))
+            )
+        return result
+
+    def iterate_tuples(self, _dataMap: dict):
+        for loopKeys, getter in self.segments:
+            seen_tuple = set()
+            for values in product(*[_dataMap[key] for key in loopKeys]):
+                reordered_vals = getter(values)
+                if reordered_vals not in seen_tuple:
+                    seen_tuple.add(reordered_vals)
+                    yield reordered_vals
+
+
+class LazyConsumptionTuples:
+    """
+    Consumption tuples generated on iteration, in the same order and with the same per segment
+    de-duplication as ConsumptionPlan.form_tuples. Consumers that stop once the order is filled never
+    build the remaining tuples.
+    """
+
+    def __init__(self, _plan: ConsumptionPlan, _dataMap: dict):
+        self.plan: ConsumptionPlan = _plan
+        self.data_map: dict = _dataMap
+
+    def __iter__(self):
+        return self.plan.iterate_tuples(self.data_map)
+
+    def nbytes(self) -> int:
+        return getsizeof(self) + sum(
+            getsizeof(values) for values in self.data_map.values()
+        )
+
+
+class NettingCheckpoint:
+    """
+    Stage boundary snapshots of the stage state of a DemandNetting instance in a local directory.
+    DataFrame attributes are written as Parquet files (pickle when pyarrow is not available or a frame
+    can not be written as Parquet), every other attribute is pickled into the manifest together with
+    the name of the completed stage and the digest of the run's inputs and parameters. The manifest is
+    replaced last, so a partly written checkpoint leaves the previous one usable.
+    """
+
+    MANIFEST: str = "checkpoint.pkl"
+    EXCLUDED: tuple = ("logger", "checkpoint")
+
+    def __init__(self, _directory: str):
+        self.directory: str = _directory
+
+    def write_frame(self, _name: str, _data: DataFrame) -> str:
+        if PARQUET_AVAILABLE:
+            fileName = f"{_name}.parquet"
+            try:
+                _data.to_parquet(os.path.join(self.directory, fileName))
+                return fileName
+            except Exception:
+                # Mixed typed object columns and non string headers are not Parquet compatible.
+                pass
+        fileName = f"{_name}.pkl"
+        _data.to_pickle(os.path.join(self.directory, fileName))
+        return fileName
+
+    def read_frame(self, _fileName: str) -> DataFrame:
+        path = os.path.join(self.directory, _fileName)
+        if _fileName.endswith(".parquet"):
+            return read_parquet(path)
+        return read_pickle(path)
+
+    def save(self, _stage: str, _attributes: dict, _digest: str = ""):
+        os.makedirs(self.directory, exist_ok=True)
+        frames = {}
+        attributes = {}
+        for name, value in _attributes.items():
+            if name in self.EXCLUDED:
+                continue
+            if isinstance(value, DataFrame):
+                frames[name] = self.write_frame(f"{_stage}.{name}", value)
+            else:
+                attributes[name] = value
+        path = os.path.join(self.directory, self.MANIFEST)
+        with open(f"{path}.tmp", "wb") as manifestFile:
+            pickle.dump(
+                {"stage": _stage, "digest": _digest, "frames": frames, "attributes": attributes},
+                manifestFile,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(f"{path}.tmp", path)
+        # Frames of earlier stages are no longer referenced.
+        current = set(frames.values()) | {self.MANIFEST}
+        for fileName in os.listdir(self.directory):
+            if fileName.endswith((".parquet", ".pkl")) and fileName not in current:
+                os.remove(os.path.join(self.directory, fileName))
+
+    def load(self):
+        path = os.path.join(self.directory, self.MANIFEST)
+        if not os.path.exists(path):
+            return None, {}, None
+        with open(path, "rb") as manifestFile:
+            manifest = pickle.load(manifestFile)
+        attributes = manifest["attributes"]
+        for name, fileName in manifest["frames"].items():
+            attributes[name] = self.read_frame(fileName)
+        return manifest["stage"], attributes, manifest.get("digest", None)
+
+
+class NettingState:
+    """
+    Netting state persisted between runs: the merged order and forecast inputs, the outputs, and the
+    netting result of every consumption component keyed by a digest of its inputs and of the pegging
+    it was recorded with. Only results used by the last run are kept. The results replace the netting
+    kernel work only: candidate resolution, demand types and pegging are rebuilt for all inputs.
+    """
+
+    FILE_NAME: str = "netting_state.pkl"
+
+    def __init__(self):
+        self.orders = None
+        self.forecasts = None
+        self.outputs: dict = {}
+        self.stored_results: dict = {}
+        self.results: dict = {}
+        self.reused: int = 0
+
+    @staticmethod
+    def digest(_orderQty, _forecastQty, _candidates: list, _pegging: str = "") -> bytes:
+        """_pegging is the pegging granularity of the run, empty without pegging."""
+        digest = blake2b(digest_size=20)
+        digest.update(_pegging.encode())
+        digest.update(_orderQty.astype(float).tobytes())
+        digest.update(_forecastQty.astype(float).tobytes())
+        digest.update(array([len(candidate) for candidate in _candidates], dtype=int64).tobytes())
+        digest.update(concatenate(_candidates).astype(int64).tobytes())
+        return digest.digest()
+
+    def lookup(self, _key):
+        result = self.results.get(_key, None)
+        if result is None:
+            result = self.stored_results.get(_key, None)
+            if result is not None:
+                self.results[_key] = result
+                self.reused += 1
+        return result
+
+    def record(self, _key, _result):
+        self.results[_key] = _result
+
+    def apply_change_set(
+            self,
+            _orderChanges: DataFrame,
+            _forecastDeltas: DataFrame,
+            _demandId: str,
+            _orderQty: str,
+            _forecastKeys: list,
+            _forecastMeasures: list,
+    ) -> (DataFrame, DataFrame):
+        """
+        Orders: the rows of every Demand ID in _orderChanges replace its stored rows, a Demand ID whose
+        changed rows have no _orderQty is cancelled.
+        Forecasts: rows of _forecastDeltas matching a stored key add their measures to the stored ones and
+        overwrite the other given columns, rows of new keys are appended.
+        """
+        orders = self.orders[~self.orders[_demandId].isin(_orderChanges[_demandId])]
+        orders = concat(
+            [orders, _orderChanges[_orderChanges[_orderQty].notna()]], ignore_index=True
+        )
+
+        forecasts = self.forecasts.reset_index(drop=True)
+        if len(_forecastDeltas) > 0:
+            storedKeys = forecasts.set_index(_forecastKeys).index
+            deltaKeys = _forecastDeltas.set_index(_forecastKeys).index
+            positions = storedKeys.get_indexer(deltaKeys)
+            isStored = positions >= 0
+            updates = _forecastDeltas[isStored]
+            targets = positions[isStored]
+            for column in _forecastDeltas.columns:
+                if column in _forecastKeys or column not in forecasts.columns:
+                    continue
+                given = updates[column].notna().to_numpy()
+                values = updates[column].to_numpy()
+                if column in _forecastMeasures:
+                    values = (
+                        forecasts[column].iloc[targets].fillna(0).to_numpy()
+                        + updates[column].fillna(0).to_numpy()
+                    )
+                # forecasts has a RangeIndex, so positions are labels.
+                forecasts.loc[targets[given], column] = values[given]
+            forecasts = concat([forecasts, _forecastDeltas[~isStored]], ignore_index=True)
+        return orders, forecasts
+
+    def save(self, _directory: str):
+        os.makedirs(_directory, exist_ok=True)
+        path = os.path.join(_directory, self.FILE_NAME)
+        with open(f"{path}.tmp", "wb") as stateFile:
+            pickle.dump(
+                {
+                    "orders": self.orders,
+                    "forecasts": self.forecasts,
+                    "outputs": self.outputs,
+                    "results": self.results,
+                },
+                stateFile,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, _directory: str):
+        state = cls()
+        path = os.path.join(_directory, cls.FILE_NAME)
+        if os.path.exists(path):
+            with open(path, "rb") as stateFile:
+                data = pickle.load(stateFile)
+            state.orders = data["orders"]
+            state.forecasts = data["forecasts"]
+            state.outputs = data["outputs"]
+            state.stored_results = data["results"]
+        return state
+
+
+class PeggingIndex:
+    """
+    Inverted indexes over a pegging output: the rows of every Demand ID and of every forecast key
+    (item, location, customer and time, or item, location and customer for time ranges). Rows are
+    sorted by forecast time, so time ranges are a binary search within the rows of a key.
+    Chunks written by a PeggingSink can be indexed with PeggingIndex(sink.read(), ...).
+    """
+
+    FILE_NAME: str = "pegging_index.pkl"
+
+    def __init__(self, _pegging: DataFrame, _demandIdColumn: str, _forecastColumns: list, _timeColumn: str):
+        times = _pegging[_timeColumn].to_numpy()
+        self.pegging: DataFrame = _pegging.take(times.argsort(kind="stable")).reset_index(drop=True)
+        self.times = self.pegging[_timeColumn].to_numpy()
+        if len(self.pegging) == 0:
+            self.demand_rows: dict = {}
+            self.forecast_rows: dict = {}
+            self.forecast_key_rows: dict = {}
+            return
+        self.demand_rows = self.pegging.groupby(_demandIdColumn, sort=False, dropna=False).indices
+        self.forecast_rows = self.pegging.groupby(
+            _forecastColumns, sort=False, dropna=False
+        ).indices
+        self.forecast_key_rows = self.pegging.groupby(
+            _forecastColumns + [_timeColumn], sort=False, dropna=False
+        ).indices
+
+    def select(self, _rows, _start, _end) -> DataFrame:
+        if _rows is None:
+            return self.pegging.iloc[:0]
+        if _start is not None or _end is not None:
+            times = self.times[_rows]
+            if times.dtype.kind == "M":
+                _start = None if _start is None else to_datetime(_start).to_datetime64()
+                _end = None if _end is None else to_datetime(_end).to_datetime64()
+            first = 0 if _start is None else times.searchsorted(_start, side="left")
+            last = len(times) if _end is None else times.searchsorted(_end, side="right")
+            _rows = _rows[first:last]
+        return self.pegging.take(_rows)
+
+    def by_demand_id(self, _demandId, _start=None, _end=None) -> DataFrame:
+        """Pegging rows of a Demand ID, optionally only forecasts in [_start, _end]."""
+        return self.select(self.demand_rows.get(_demandId), _start, _end)
+
+    def by_forecast(self, _item, _location, _customer, _time) -> DataFrame:
+        """Pegging rows that consumed a forecast bucket."""
+        return self.select(
+            self.forecast_key_rows.get((_item, _location, _customer, _time)), None, None
+        )
+
+    def by_forecast_range(self, _item, _location, _customer, _start=None, _end=None) -> DataFrame:
+        """Pegging rows that consumed forecasts of an item, location and customer in [_start, _end]."""
+        return self.select(self.forecast_rows.get((_item, _location, _customer)), _start, _end)
+
+    def save(self, _directory: str):
+        os.makedirs(_directory, exist_ok=True)
+        path = os.path.join(_directory, self.FILE_NAME)
+        with open(f"{path}.tmp", "wb") as indexFile:
+            pickle.dump(self, indexFile, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, _directory: str):
+        with open(os.path.join(_directory, cls.FILE_NAME), "rb") as indexFile:
+            return pickle.load(indexFile)
+
+
+class DimensionEncoder:
+    """
+    Shared int32 code tables for the Item, Location, Sales Domain, Time and Demand dimensions.
+    Every attribute column of a dimension (e.g. Item.[Item] and Item.[L1], or from.[Item].[Item] of the
+    association graph) is coded against the same table. Tables hold the sorted values, so sorting and
+    grouping on codes gives the same order as on the strings they replace.
+    """
+
+    DIMENSIONS: tuple = ("Item", "Location", "Sales Domain", "Time", "Demand")
+
+    def __init__(self):
+        self.tables: dict = {}
+        self.indexes: dict = {}
+
+    @staticmethod
+    def dimension_of(column: str):
+        column = str(column)
+        if column.lower().startswith(("from.", "to.")):
+            column = column.split(".", 1)[1].lstrip("[").replace("]", "", 1)
+        if ".[" not in column:
+            return None
+        dimension = column.split(".[")[0]
+        return dimension if dimension in DimensionEncoder.DIMENSIONS else None
+
+    def fit(self, _frames: list, _extraValues: dict = None):
+        values = defaultdict(list)
+        for frame in _frames:
+            for column in frame.columns:
+                dimension = self.dimension_of(column)
+                if dimension is not None:
+                    values[dimension].append(frame[column].to_numpy(dtype=object))
+        for dimension, extra in (_extraValues or {}).items():
+            values[dimension].append(array([str(value) for value in extra], dtype=object))
+        for dimension, chunks in values.items():
+            self.tables[dimension] = unique(concatenate(chunks))
+            self.indexes[dimension] = Index(self.tables[dimension])
+
+    def is_encoded(self, column: str) -> bool:
+        return self.dimension_of(column) in self.tables
+
+    def encode(self, _data: DataFrame):
+        for column in _data.columns:
+            dimension = self.dimension_of(column)
+            if dimension in self.tables:
+                _data[column] = (
+                    self.indexes[dimension].get_indexer(_data[column].to_numpy()).astype(int32)
+                )
+
+    def encode_value(self, dimension: str, value):
+        return int(self.indexes[dimension].get_loc(str(value)))
+
+    def decode(self, _data: DataFrame):
+        for column in _data.columns:
+            dimension = self.dimension_of(column)
+            if dimension not in self.tables:
+                continue
+            codes = _data[column].to_numpy()
+            if codes.dtype.kind in "iu":
+                _data[column] = self.tables[dimension][codes]
+            else:
+                missing = isna(codes)
+                values = empty(len(codes), dtype=object)
+                values[missing] = codes[missing]
+                values[~missing] = self.tables[dimension][codes[~missing].astype(int64)]
+                _data[column] = values
+
+
+class HierarchyIndex:
+    """
+    Hierarchy of one master, built with factorize instead of row by row.
+    Level i of _colHierarchy (0 is the leaf column) is stored as the parent code of every leaf, taken
+    from the last master row of that leaf, and the leaves under every parent in CSR form
+    (children_values[i][offsets[i][parent]:offsets[i][parent + 1]], in master row order).
+    Rows without a parent at a level are not listed under any parent of that level.
+    """
+
+    def __init__(self, _master: DataFrame, _colHierarchy: dict):
+        leafValues = _master[_colHierarchy[0]].to_numpy()
+        leafCodes, leaves = factorize(leafValues, use_na_sentinel=False)
+        lastRows = (
+            Series(arange(len(leafCodes)))
+            .groupby(leafCodes, sort=True)
+            .max()
+            .to_numpy()
+        )
+        self.leaf_positions: dict = {
+            leaf: position for position, leaf in enumerate(leaves.tolist())
+        }
+        self.parent_codes: dict = {}
+        self.offsets: dict = {}
+        self.children_values: dict = {}
+        for level, column in _colHierarchy.items():
+            if level == 0:
+                continue
+            parentCodes, parents = factorize(_master[column].to_numpy())
+            self.parent_codes[level] = parentCodes[lastRows]
+            rows = flatnonzero(parentCodes >= 0)
+            rows = rows[parentCodes[rows].argsort(kind="stable")]
+            self.children_values[level] = leafValues[rows]
+            self.offsets[level] = concatenate(
+                ([0], bincount(parentCodes[rows], minlength=len(parents)).cumsum())
+            )
+
+    def children(self, _level: int, _leafPosition: int) -> list:
+        parent = self.parent_codes[_level][_leafPosition]
+        if parent < 0:
+            return []
+        offsets = self.offsets[_level]
+        return self.children_values[_level][offsets[parent]: offsets[parent + 1]].tolist()
+
+
+class AssociationGraph:
+    """
+    Order to forecast association graph, sorted once by from key and priority.
+    From keys are coded in that order, so the rows of every from key are contiguous and adjacency()
+    only has to filter the rows of an association measure into CSR offsets.
+    """
+
+    def __init__(self, _graph: DataFrame, _fromColumns: list, _toColumns: list, _priority: str):
+        self.graph: DataFrame = _graph.sort_values(by=_fromColumns + [_priority])
+        self.from_codes: dict = {}
+        self.row_from = array(
+            [
+                self.from_codes.setdefault(fromKey, len(self.from_codes))
+                for fromKey in zip(*[self.graph[column].tolist() for column in _fromColumns])
+            ],
+            dtype=int64,
+        )
+        self.to_keys: list = list(
+            zip(*[self.graph[column].tolist() for column in _toColumns])
+        )
+
+    def adjacency(self, _association: str, _keyCodes: dict):
+        """
+        CSR offsets per from code over the rows with _association == 1, and the code in _keyCodes of every
+        row's to key (-1 when it has no forecasts).
+        """
+        rows = flatnonzero(self.graph[_association].values == 1)
+        offsets = concatenate(
+            ([0], bincount(self.row_from[rows], minlength=len(self.from_codes)).cumsum())
+        )
+        rowKeys = array(
+            [_keyCodes.get(self.to_keys[row], -1) for row in rows.tolist()], dtype=int64
+        )
+        return offsets, rowKeys
+
+
+class ForecastTimeIndex:
+    """
+    forecastToIndexMap as arrays: forecast indices sorted by (key code, time bucket position), with the
+    composite key code * bucket count + position alongside, so the forecasts of a key in a window of
+    buckets are one searchsorted slice. Forecasts in buckets outside the time buckets are left out.
+    """
+
+    def __init__(self, _forecastToIndexMap: dict, _timeBucketPosition: dict):
+        self.key_codes: dict = {}
+        self.bucket_count: int = len(_timeBucketPosition)
+        composite = []
+        forecastIndices = []
+        for key, timeIndices in _forecastToIndexMap.items():
+            keyCode = self.key_codes.setdefault(key, len(self.key_codes))
+            for forecastTime, forecastIndex in timeIndices.items():
+                position = _timeBucketPosition.get(forecastTime, None)
+                if position is not None:
+                    composite.append(keyCode * self.bucket_count + position)
+                    forecastIndices.append(forecastIndex)
+        composite = array(composite, dtype=int64)
+        order = composite.argsort(kind="stable")
+        self.composite = composite[order]
+        self.forecast_indices = array(forecastIndices, dtype=int64)[order]
+
+    def window_indices(self, _keyCodes, _curTimeIndex: int, _backward: int, _forward: int,
+                       _backwardBeforeCurrent: bool = False):
+        """
+        Per key in order: the current bucket, the backward buckets (nearest first, farthest first with
+        _backwardBeforeCurrent) and the forward buckets (nearest first).
+        """
+        base = _keyCodes * self.bucket_count
+        curStart = self.composite.searchsorted(base + _curTimeIndex)
+        curEnd = self.composite.searchsorted(base + _curTimeIndex + 1)
+        backStart = self.composite.searchsorted(base + max(_curTimeIndex - _backward, 0))
+        forwardEnd = self.composite.searchsorted(
+            base + min(_curTimeIndex + 1 + _forward, self.bucket_count)
+        )
+        backLength = curStart - backStart
+        ones = ones_like(curStart)
+        if _backwardBeforeCurrent:
+            backFirst, backStep = backStart, ones
+        else:
+            backFirst, backStep = curStart - 1, -ones
+        # Segments per key: current, backward, forward.
+        firsts = array([curStart, backFirst, curEnd]).T.ravel()
+        steps = array([ones, backStep, ones]).T.ravel()
+        lengths = array([curEnd - curStart, backLength, forwardEnd - curEnd]).T.ravel()
+        total = int(lengths.sum())
+        if total == 0:
+            return empty(0, dtype=int64)
+        segments = arange(len(lengths)).repeat(lengths)
+        within = arange(total) - (lengths.cumsum() - lengths).repeat(lengths)
+        return self.forecast_indices[firsts[segments] + steps[segments] * within]
+
+
 class DemandNetting:
     """Demand Netting Logic"""
 
@@ -166,7 +1117,7 @@ class DemandNetting:
     ):
         self.startTime = time()
         self.class_name: str = __name__
-        self.class_version: str = "v24.5"
+        self.class_version: str = "v24.6"
         self.logger = logger
         # Inputs
         self.in_orders: DataFrame = in_orders
@@ -243,6 +1194,103 @@ class DemandNetting:
             )
         )
 
+        self.use_array_kernel: bool = string_to_bool(
+            str(self.parameters.get(Config.DN_ARRAY_KERNEL, Config.ARRAY_KERNEL))
+        )
+        self.encode_dimensions: bool = string_to_bool(
+            str(
+                self.parameters.get(
+                    Config.DN_ENCODE_DIMENSIONS, Config.ENCODE_DIMENSIONS
+                )
+            )
+        )
+        self.encoder = None
+        self.tuple_cache_size: int = string_to_int(
+            self.parameters.get(Config.DN_TUPLE_CACHE_SIZE, Config.TUPLE_CACHE_SIZE)
+        )
+        self.lazy_tuples: bool = string_to_bool(
+            str(self.parameters.get(Config.DN_LAZY_TUPLES, Config.LAZY_TUPLES))
+        )
+        self.netting_workers: int = max(
+            string_to_int(
+                self.parameters.get(Config.DN_NETTING_WORKERS, Config.NETTING_WORKERS)
+            ),
+            1,
+        )
+        self.state_directory: str = self.parameters.get(
+            Config.DN_STATE_DIRECTORY, Config.STATE_DIRECTORY
+        )
+        # Incremental Netting reuses kernel results only, all stages still run on the merged inputs.
+        self.incremental_netting: bool = string_to_bool(
+            str(
+                self.parameters.get(
+                    Config.DN_INCREMENTAL_NETTING, Config.INCREMENTAL_NETTING
+                )
+            )
+        )
+        self.netting_state = None
+        if self.state_directory:
+            self.netting_state = NettingState.load(self.state_directory)
+        self.checkpoint_directory: str = self.parameters.get(
+            Config.DN_CHECKPOINT_DIRECTORY, Config.CHECKPOINT_DIRECTORY
+        )
+        self.resume_from_checkpoint: bool = string_to_bool(
+            str(
+                self.parameters.get(
+                    Config.DN_RESUME_FROM_CHECKPOINT, Config.RESUME_FROM_CHECKPOINT
+                )
+            )
+        )
+        self.checkpoint = None
+        if self.checkpoint_directory:
+            self.checkpoint = NettingCheckpoint(self.checkpoint_directory)
+        self.pegging_sink_directory: str = self.parameters.get(
+            Config.DN_PEGGING_SINK_DIRECTORY, Config.PEGGING_SINK_DIRECTORY
+        )
+        self.pegging_sink_chunk_rows: int = max(
+            1,
+            string_to_int(
+                str(
+                    self.parameters.get(
+                        Config.DN_PEGGING_SINK_CHUNK_ROWS, Config.PEGGING_SINK_CHUNK_ROWS
+                    )
+                )
+            ),
+        )
+        # Consumption: one pegging row per consumption, Order Forecast: one row per order and forecast
+        # key of a netting pass.
+        self.pegging_granularity: str = self.parameters.get(
+            Config.DN_PEGGING_GRANULARITY, Config.PEGGING_GRANULARITY
+        )
+        if self.pegging_granularity not in ("Consumption", "Order Forecast"):
+            raise PluginException(
+                f"Invalid Pegging Granularity: {self.pegging_granularity}"
+            )
+        self.pegging_index_directory: str = self.parameters.get(
+            Config.DN_PEGGING_INDEX_DIRECTORY, Config.PEGGING_INDEX_DIRECTORY
+        )
+        self.pegging_index = None
+        self.pegging_sink = None
+        if self.pegging_sink_directory:
+            self.pegging_sink = PeggingSink(
+                self.pegging_sink_directory, self.pegging_sink_chunk_rows
+            )
+        if self.netting_workers > 1 or self.netting_state is not None:
+            # Components are netted by the array kernel.
+            if Config.DN_ARRAY_KERNEL in self.parameters and not self.use_array_kernel:
+                raise PluginException(
+                    f"{Config.DN_NETTING_WORKERS} > 1 or a {Config.DN_STATE_DIRECTORY} needs the array "
+                    f"kernel, {Config.DN_ARRAY_KERNEL} can not be disabled with it."
+                )
+            self.use_array_kernel = True
+        if self.lazy_tuples and self.use_array_kernel:
+            # The kernel takes every candidate of an order up front, lazy tuples would all be generated.
+            self.plugin_log(
+                f"{Config.DN_LAZY_TUPLES} has no effect with the array kernel, tuples are generated up front.",
+                "warn",
+            )
+            self.lazy_tuples = False
+
         self.output_at_aggregated_level: bool = string_to_bool(
             str(
                 self.parameters.get(
@@ -431,8 +1479,19 @@ class DemandNetting:
         self.orders_seen: set = set()
         self.forecasts_seen: set = set()
         self.all_time_buckets: list = []
+        self.time_bucket_position: dict = {}
+        self.time_window_cache: dict = {}
         self.default_demand_ids: list = []
-        self.pegging: list = []
+        self.pegging_recorder = PeggingRecorder(
+            _aggregate=self.pegging_granularity == "Order Forecast"
+        )
+        # With a pegging sink the open segment is written once it holds this many rows, 0 never.
+        self.pegging_flush_rows: int = (
+            self.pegging_sink_chunk_rows if self.pegging_sink is not None else 0
+        )
+        self.pegging_forecast_keys = None
+        # Order grain of the pegging of the current pass, None for the order grain.
+        self.pegging_order_grain = None
         self.original_forecast_grain: list = []
         self.order_grain: list = [self.ITEM, self.LOCATION, self.CUSTOMER, self.TIME]
         self.forecast_grain: list = [
@@ -446,13 +1505,19 @@ class DemandNetting:
         ]
         self.forecastToIndexMap: dict = {}
         self.originalForecastToIndexMap: dict = {}
-        self.forecastIndexForPeggingMap: dict = {}
-        self.item_map: dict = {}
-        self.customer_map: dict = {}
-        self.time_map: dict = {}
-        self.location_map: dict = {}
-        self.order_forecast_map_hash: dict = {}
-        self.order_consumption_tuples: dict = {}
+        self.item_hierarchy = None
+        self.customer_hierarchy = None
+        self.time_hierarchy = None
+        self.location_hierarchy = None
+        self.sibling_cache: dict = {}
+        self.present_children_cache: dict = {}
+        self.consumption_plan = None
+        self.association_graph = None
+        self.graph_association: str = ""
+        self.graph_offsets = None
+        self.graph_row_keys = None
+        self.forecast_time_index = None
+        self.order_consumption_tuples = ConsumptionTupleCache(self.tuple_cache_size)
         self.os_map: dict = {}
         self.fs_map: dict = {}
         self.empty_forecast_indices: dict = {}
@@ -477,8 +1542,11 @@ class DemandNetting:
             for index, column in enumerate(reversed(time_columns_without_keys))
         }
         self.time_priority_data: DataFrame = DataFrame()
+        # Max time priority per time column, by column.
+        self.time_priority_cache: dict = {}
+        # Sorted unique values of the string sort columns of set_order_priority, by column.
+        self.priority_code_tables: dict = {}
         self.original_in_forecast: DataFrame = DataFrame()
-        self.finalPegging: dict = defaultdict(list)
 
         # Log
         self.plugin_log(f"Class Version: {len(self.class_version)}")
@@ -497,6 +1565,17 @@ class DemandNetting:
         self.plugin_log(f"Split Demand Type: {self.split_demand_type}")
         self.plugin_log(f"Using Aggregate Netting: {self.use_aggregate}")
         self.plugin_log(f"Using Multistream Netting: {self.use_multi_stream}")
+        self.plugin_log(f"Using Array Netting Kernel: {self.use_array_kernel}")
+        self.plugin_log(f"Netting Parallel Workers: {self.netting_workers}")
+        self.plugin_log(f"Netting State Directory: {self.state_directory}")
+        self.plugin_log(f"Incremental Netting: {self.incremental_netting}")
+        self.plugin_log(f"Netting Checkpoint Directory: {self.checkpoint_directory}")
+        self.plugin_log(f"Resume From Checkpoint: {self.resume_from_checkpoint}")
+        self.plugin_log(f"Pegging Sink Directory: {self.pegging_sink_directory}")
+        self.plugin_log(f"Pegging Sink Chunk Rows: {self.pegging_sink_chunk_rows}")
+        self.plugin_log(f"Pegging Granularity: {self.pegging_granularity}")
+        self.plugin_log(f"Pegging Index Directory: {self.pegging_index_directory}")
+        self.plugin_log(f"Using Encoded Dimension Keys: {self.encode_dimensions}")
 
         if not self.use_order_forecast_map:
             self.in_orderForecastMapGraph = DataFrame()
@@ -509,6 +1588,12 @@ class DemandNetting:
         self.final_time_attribute = to_key_col(self.final_time_attribute)
         self.order_id_due_date_map: DataFrame = DataFrame()
         self.profile_output: bool = True
+        # Stage outputs, kept on the instance so they are part of the checkpoints.
+        self.skip_order_output: DataFrame = DataFrame()
+        self.skip_forecast_output: DataFrame = DataFrame()
+        self.order_demand_type_output: DataFrame = DataFrame()
+        self.forecast_demand_type_output: DataFrame = DataFrame()
+        self.pegging_output: DataFrame = DataFrame()
 
     def plugin_log(self, _msg, _type=""):
         elapsed = time() - self.startTime
@@ -614,6 +1699,8 @@ class DemandNetting:
         pegging_output: DataFrame = DataFrame(columns=pegging_grain)
 
         try:
+            if self.netting_state is not None:
+                self.prepare_netting_state()
             self.early_exit_conditions()
             self.order_id_due_date_map = self.in_orders[
                 [self.DEMAND_ID, self.order_due_date]
@@ -634,62 +1721,16 @@ class DemandNetting:
                     skip_netting.run_skip_netting()
                 )
             else:
-                skip_order_output, skip_forecast_output = self.split_on_order_horizon()
-                # Clean Inputs.
-                self.preprocess_inputs()
-                if self.use_aggregate:
-                    # Get Aggregate Grains
-                    self.get_aggregate_grains()
-                # Clean Order and Forecast Data
-                self.setup_orders()
-                self.setup_forcast()
-                # Create Forecast Lookups.
-                self.create_forecast_lookup()
-                # Create Hierarchy Maps.
-                self.create_hierarchical_maps()
-                # Set Order Priority
-                self.set_order_priority()
-                # Core Netting
-                if self.use_order_forecast_map:
-                    self.run_graph_netting()
-                else:
-                    if self.use_multi_stream:
-                        self.run_multistream_netting()
-                    else:
-                        if self.use_aggregate:
-                            self.run_aggregate_netting()
-                        else:
-                            self.run_common_netting()
-                # Get Demand Type.
-                print()
-                order_demand_type_output, forecast_demand_type_output = (
-                    self.get_demand_types()
-                )
-                if self.use_multi_stream:
-                    if not order_demand_type_output.empty:
-                        self.past_orders = self.past_orders[
-                            list(order_demand_type_output.columns)
-                        ]
-                        output_demand_types = concat(
-                            [order_demand_type_output, self.past_orders], ignore_index=True
-                        )
-                # Telescopic Time
-                if self.use_aggregate and self.output_at_aggregated_level:
-                    self.ITEM = self.f_item
-                    self.LOCATION = self.f_location
-                    self.CUSTOMER = self.f_customer
-                    self.TIME = self.f_time
-                    self.profile_output = False
-
-                # Get Pegging Data.
-                pegging_output = self.get_pegging_data()
+                self.run_netting_stages()
                 # concatenating outputs from skip netting
                 order_demand_type_output = concat(
-                    [order_demand_type_output, skip_order_output], ignore_index=True
+                    [self.order_demand_type_output, self.skip_order_output], ignore_index=True
                 )
                 forecast_demand_type_output = concat(
-                    [forecast_demand_type_output, skip_forecast_output], ignore_index=True
+                    [self.forecast_demand_type_output, self.skip_forecast_output],
+                    ignore_index=True,
                 )
+                pegging_output = self.pegging_output
                 # Decimal Issue
                 order_demand_type_output[self.netted_demand_qty] = order_demand_type_output[
                     self.netted_demand_qty
@@ -790,9 +1831,29 @@ class DemandNetting:
 
             pegging_output[self.peg_from_time] = to_datetime(pegging_output[self.peg_from_time])
             pegging_output[self.peg_to_time] = to_datetime(pegging_output[self.peg_to_time])
+            if self.pegging_flag:
+                self.pegging_index = PeggingIndex(
+                    pegging_output,
+                    self.peg_from_demand_id,
+                    [self.peg_to_item, self.peg_to_location, self.peg_to_customer],
+                    self.peg_to_time,
+                )
+                if self.pegging_index_directory:
+                    self.pegging_index.save(self.pegging_index_directory)
 
             order_demand_type_output = self.col_name_reorder(order_demand_type_output)
             forecast_demand_type_output = self.col_name_reorder(forecast_demand_type_output)
+            if self.netting_state is not None:
+                self.netting_state.outputs = {
+                    "order_demand_types": order_demand_type_output,
+                    "forecast_demand_types": forecast_demand_type_output,
+                    "pegging": pegging_output,
+                }
+                self.netting_state.save(self.state_directory)
+                self.plugin_log(
+                    f"Netting State saved: {len(self.netting_state.results)} components "
+                    f"({self.netting_state.reused} reused)."
+                )
         except PluginException as e:
             self.plugin_log(e)
 
@@ -802,6 +1863,193 @@ class DemandNetting:
             pegging_output,
         )
 
+    def get_netting_stages(self) -> list:
+        stages = [
+            ("order_horizon", self.run_order_horizon_stage),
+            # Clean Inputs.
+            ("preprocess", self.preprocess_inputs),
+        ]
+        if self.use_aggregate:
+            # Get Aggregate Grains
+            stages.append(("aggregate_grains", self.get_aggregate_grains))
+        stages += [
+            # Clean Order and Forecast Data
+            ("setup_orders", self.setup_orders),
+            ("setup_forecasts", self.setup_forcast),
+            # Create Forecast Lookups.
+            ("forecast_lookup", self.create_forecast_lookup),
+            # Create Hierarchy Maps.
+            ("hierarchy_maps", self.create_hierarchical_maps),
+            # Set Order Priority
+            ("order_priority", self.set_order_priority),
+            ("core_netting", self.run_core_netting),
+            ("demand_types", self.run_demand_type_stage),
+            ("pegging", self.run_pegging_stage),
+        ]
+        return stages
+
+    def run_netting_stages(self):
+        """
+        Run the netting stages in order. With a checkpoint directory the stage state is snapshotted after
+        every stage, and with Resume From Checkpoint the run continues after the last completed stage,
+        provided the checkpoint was written for the same inputs and parameters.
+        """
+        stages = self.get_netting_stages()
+        stageNames = [stageName for stageName, _ in stages]
+        startStage = 0
+        if self.checkpoint is None:
+            runDigest = None
+            configuration = {}
+        else:
+            runDigest = self.get_run_digest()
+            # Parameter flags are set before the first stage, they are not part of the stage state.
+            configuration = {
+                name: value
+                for name, value in self.__dict__.items()
+                if isinstance(value, (str, bool, int, float, tuple, type(None)))
+                or name in ("parameters", "in_parameters")
+            }
+        if self.checkpoint is not None and self.resume_from_checkpoint:
+            completedStage, attributes, checkpointDigest = self.checkpoint.load()
+            if completedStage not in stageNames:
+                self.plugin_log("No usable checkpoint found, running all stages.", "warn")
+            elif checkpointDigest != runDigest:
+                self.plugin_log(
+                    f"Checkpoint stage {completedStage} was written for other inputs or parameters, "
+                    f"running all stages.",
+                    "warn",
+                )
+            else:
+                self.__dict__.update(attributes)
+                startStage = stageNames.index(completedStage) + 1
+                self.plugin_log(f"Resuming after checkpoint stage: {completedStage}")
+        for stageName, stage in stages[startStage:]:
+            stage()
+            if self.checkpoint is not None:
+                stageState = {
+                    name: value
+                    for name, value in self.__dict__.items()
+                    if not (name in configuration and configuration[name] is value)
+                }
+                self.checkpoint.save(stageName, stageState, runDigest)
+                self.plugin_log(f"Checkpoint written: {stageName}")
+
+    def get_run_digest(self) -> str:
+        """
+        Digest of the inputs and parameters of the run, Resume From Checkpoint excluded, identifying the
+        run a checkpoint belongs to.
+        """
+        digest = blake2b(digest_size=20)
+        parameters = sorted(
+            (str(name), str(value))
+            for name, value in self.parameters.items()
+            if name != Config.DN_RESUME_FROM_CHECKPOINT
+        )
+        digest.update(repr(parameters).encode())
+        for name in (
+                "in_orders",
+                "in_forecasts",
+                "in_RTFs",
+                "master_item",
+                "master_location",
+                "master_customer",
+                "master_time",
+                "in_telescopic",
+                "in_orderForecastMapGraph",
+                "in_orderStreamParameters",
+                "in_forecastStreamParameters",
+                "in_pastOrderDate",
+                "in_basis",
+        ):
+            frame = getattr(self, name)
+            digest.update(repr((name, list(frame.columns), list(frame.dtypes.astype(str)))).encode())
+            digest.update(hash_pandas_object(frame, index=True).to_numpy().tobytes())
+        return digest.hexdigest()
+
+    def run_order_horizon_stage(self):
+        self.skip_order_output, self.skip_forecast_output = self.split_on_order_horizon()
+
+    def run_core_netting(self):
+        if self.use_order_forecast_map:
+            self.run_graph_netting()
+        else:
+            if self.use_multi_stream:
+                self.run_multistream_netting()
+            else:
+                if self.use_aggregate:
+                    self.run_aggregate_netting()
+                else:
+                    self.run_common_netting()
+
+    def run_demand_type_stage(self):
+        # Get Demand Type.
+        print()
+        self.order_demand_type_output, self.forecast_demand_type_output = (
+            self.get_demand_types()
+        )
+        if self.encoder is not None:
+            self.encoder.decode(self.order_demand_type_output)
+            self.encoder.decode(self.forecast_demand_type_output)
+        if self.use_multi_stream:
+            if not self.order_demand_type_output.empty:
+                self.past_orders = self.past_orders[
+                    list(self.order_demand_type_output.columns)
+                ]
+                output_demand_types = concat(
+                    [self.order_demand_type_output, self.past_orders], ignore_index=True
+                )
+
+    def run_pegging_stage(self):
+        # Telescopic Time
+        if self.use_aggregate and self.output_at_aggregated_level:
+            self.ITEM = self.f_item
+            self.LOCATION = self.f_location
+            self.CUSTOMER = self.f_customer
+            self.TIME = self.f_time
+            self.profile_output = False
+
+        # Get Pegging Data.
+        self.pegging_output = self.get_pegging_data()
+        if self.encoder is not None:
+            self.encoder.decode(self.pegging_output)
+        if self.pegging_sink is not None and self.pegging_flag:
+            self.pegging_sink.close()
+            self.plugin_log(
+                f"Pegging written to {self.pegging_sink_directory}: {self.pegging_sink.rows} rows in "
+                f"{len(self.pegging_sink.chunk_files)} chunks."
+            )
+
+    def prepare_netting_state(self):
+        """
+        With Incremental Netting the order and forecast inputs are a change set applied to the inputs of
+        the previous run, otherwise they replace them. The merged inputs are kept for the next run.
+        All stages still run on the merged inputs; only net_with_state skips work.
+        """
+        if self.incremental_netting:
+            if self.netting_state.orders is None:
+                self.plugin_log(
+                    "No Netting State found, netting the inputs as a full run.", "warn"
+                )
+            else:
+                forecastMeasures = [self.forecast_qty]
+                if self.fs_stream in self.in_forecastStreamParameters.columns:
+                    forecastMeasures += list(
+                        self.in_forecastStreamParameters[self.fs_stream].dropna()
+                    )
+                self.plugin_log(
+                    f"Applying Change Set: {len(self.in_orders)} orders, {len(self.in_forecasts)} forecasts."
+                )
+                self.in_orders, self.in_forecasts = self.netting_state.apply_change_set(
+                    self.in_orders,
+                    self.in_forecasts,
+                    self.DEMAND_ID,
+                    self.order_qty,
+                    [self.VERSION, self.ITEM, self.LOCATION, self.CUSTOMER, self.TIME],
+                    forecastMeasures,
+                )
+        self.netting_state.orders = self.in_orders.copy()
+        self.netting_state.forecasts = self.in_forecasts.copy()
+
     def col_name_reorder(self, df):
         dim_cols = [col for col in df.columns if ".[" in col]
         measure_cols = [col for col in df.columns if ".[" not in col]
@@ -1052,6 +2300,55 @@ class DemandNetting:
 
         self.original_forecast_grain = self.forecast_grain
 
+        if self.encode_dimensions:
+            self.encode_inputs()
+
+    def encode_inputs(self):
+        """
+        Replace the dimension columns of the netting inputs by codes of one shared DimensionEncoder.
+        Everything built from these frames (lookups, hierarchy maps, consumption tuples, sort keys and
+        pegging) is then keyed on int32 codes, outputs are decoded in run_demand_netting.
+        """
+        self.plugin_log("Encoding Dimension Keys.")
+        frames = [
+            self.in_orders,
+            self.in_forecasts,
+            self.in_RTFs,
+            self.master_item,
+            self.master_location,
+            self.master_customer,
+            self.master_time,
+            self.in_orderForecastMapGraph,
+        ]
+        forecastDemandIDs = [Config.FORECAST_DEMAND_ID] + list(self.default_demand_ids)
+        if self.fs_demand_id in self.in_forecastStreamParameters.columns:
+            forecastDemandIDs += list(
+                self.in_forecastStreamParameters[self.fs_demand_id].dropna()
+            )
+        self.encoder = DimensionEncoder()
+        self.encoder.fit(frames, {"Demand": forecastDemandIDs})
+        for frame in frames:
+            self.encoder.encode(frame)
+        self.default_demand_ids = [
+            self.encoder.encode_value("Demand", demandID)
+            for demandID in self.default_demand_ids
+        ]
+
+    def to_dimension_values(self, _data: DataFrame, _columns: list):
+        """Typecast dimension columns to String, encoded columns are left as codes."""
+        if self.encoder is not None:
+            _columns = [col for col in _columns if not self.encoder.is_encoded(col)]
+        if len(_columns) > 0:
+            _data[_columns] = _data[_columns].astype(str)
+
+    def decoded(self, _values: Series) -> Series:
+        """Dimension values as strings, for lookups that need the actual value (e.g. dates)."""
+        if self.encoder is None:
+            return _values
+        values = _values.to_frame()
+        self.encoder.decode(values)
+        return values[_values.name]
+
     def setup_orders(self):
         self.plugin_log("Cleaning Order Data.")
         # Fill Default
@@ -1088,10 +2385,11 @@ class DemandNetting:
         try:
             self.time_priority_data = self.master_time.copy()
             self.time_priority_data[self.time_key] = to_datetime(
-                self.time_priority_data[self.TIME]
+                self.decoded(self.time_priority_data[self.TIME])
             )
             self.time_priority_data.sort_values(by=self.time_key, inplace=True)
             self.time_priority_data[self.time_priority] = arange(len(self.master_time))
+            self.time_priority_cache = {}
         except Exception:
             raise Exception(f"{self.TIME} missing from the Time Hierarchy data.")
 
@@ -1112,9 +2410,7 @@ class DemandNetting:
         # SORT FORECAST BY ITS GRAIN
         self.in_forecasts.sort_values(by=self.forecast_grain, inplace=True)
         self.in_forecasts.reset_index(inplace=True)
-        self.in_forecasts[self.forecast_grain] = self.in_forecasts[
-            self.forecast_grain
-        ].astype(str)
+        self.to_dimension_values(self.in_forecasts, self.forecast_grain)
         # Check this code
         # self.in_forecasts[self.forecast_grain[3]] = to_datetime(
         #     self.in_forecasts[self.forecast_grain[3]]
@@ -1166,54 +2462,64 @@ class DemandNetting:
             list(self.in_forecasts[self.f_time].unique())
             + list(self.in_RTFs[self.f_time].unique())
         )
-        self.all_time_buckets = list(self.time_priority_data[self.TIME].unique())
-
+        # Sibling lists are filtered by the sets above.
+        self.sibling_cache = {}
+        self.present_children_cache = {}
         if self.use_aggregate:
-            self.all_time_buckets = list(self.time_priority_data[self.f_time].unique())
+            self.set_time_buckets(list(self.time_priority_data[self.f_time].unique()))
+        else:
+            self.set_time_buckets(list(self.time_priority_data[self.TIME].unique()))
+
+    def set_time_buckets(self, _timeBuckets: list):
+        """Set the ordered time buckets along with their position index, and drop cached windows."""
+        self.all_time_buckets = _timeBuckets
+        self.time_bucket_position = {
+            timeBucket: index for index, timeBucket in enumerate(_timeBuckets)
+        }
+        self.time_window_cache = {}
 
     def create_forecast_lookup(self):
         if len(self.in_forecasts) > 0:
+            self.create_forecast_hash(self.in_forecasts, self.forecast_grain, self.forecastToIndexMap)
             if self.pegging_flag:
-                vectorize(self.create_forecast_hash_with_pegging, otypes=[str])(
-                    self.in_forecasts[self.f_item],
-                    self.in_forecasts[self.f_location],
-                    self.in_forecasts[self.f_customer],
-                    self.in_forecasts[self.f_time],
-                    self.in_forecasts.index,
-                    self.forecastToIndexMap,
-                    self.forecastIndexForPeggingMap,
-                )
-            else:
-                vectorize(self.create_forecast_hash, otypes=[str])(
-                    self.in_forecasts[self.f_item],
-                    self.in_forecasts[self.f_location],
-                    self.in_forecasts[self.f_customer],
-                    self.in_forecasts[self.f_time],
-                    self.in_forecasts.index,
-                    self.forecastToIndexMap,
-                )
+                self.set_pegging_forecast_keys(self.in_forecasts)
             if self.use_aggregate:
-                vectorize(self.create_forecast_hash, otypes=[str])(
-                    self.original_in_forecast[self.original_forecast_grain[0]],
-                    self.original_in_forecast[self.original_forecast_grain[1]],
-                    self.original_in_forecast[self.original_forecast_grain[2]],
-                    self.original_in_forecast[self.original_forecast_grain[3]],
-                    self.original_in_forecast.index,
+                self.create_forecast_hash(
+                    self.original_in_forecast,
+                    self.original_forecast_grain,
                     self.originalForecastToIndexMap,
                 )
 
     @staticmethod
-    def create_forecast_hash(_item, _loc, _sales, _time, _index, _result):
-        if (_item, _loc, _sales) not in _result:
-            _result[(_item, _loc, _sales)] = {_time: _index}
-        else:
-            _result[(_item, _loc, _sales)][_time] = _index
+    def create_forecast_hash(_forecasts: DataFrame, _grain: list, _result: dict):
+        """Add (item, location, customer) -> {time: index} of every forecast row, the last row of a key wins."""
+        item, loc, sales, time = _grain
+        for key, fTime, index in zip(
+                zip(
+                    _forecasts[item].tolist(),
+                    _forecasts[loc].tolist(),
+                    _forecasts[sales].tolist(),
+                ),
+                _forecasts[time].tolist(),
+                _forecasts.index.tolist(),
+        ):
+            timeIndex = _result.get(key, None)
+            if timeIndex is None:
+                _result[key] = {fTime: index}
+            else:
+                timeIndex[fTime] = index
 
-    def create_forecast_hash_with_pegging(
-            self, _item, _loc, _sales, _time, _index, _result, _peggingResult
-    ):
-        self.create_forecast_hash(_item, _loc, _sales, _time, _index, _result)
-        _peggingResult[_index] = (_item, _loc, _sales, _time)
+    def set_pegging_forecast_keys(self, _forecasts: DataFrame):
+        """Key columns the pegged forecast (or RTF) indices of the following passes resolve to."""
+        self.pegging_forecast_keys = (
+            _forecasts.index,
+            [
+                _forecasts[self.f_item].to_numpy(),
+                _forecasts[self.f_location].to_numpy(),
+                _forecasts[self.f_customer].to_numpy(),
+                _forecasts[self.f_time].to_numpy(),
+            ],
+        )
 
     def create_hierarchical_maps(self):
         self.plugin_log("Filter Unused Master Data.")
@@ -1253,49 +2559,18 @@ class DemandNetting:
 
         self.plugin_log("Creating Hierarchical Maps.")
         # CREATE HIERARCHICAL MAPS
-        self.master_item.apply(
-            lambda _x: self.hierarchy_data_tree(
-                _x.to_dict(), self.item_col_hierarchy, self.item_map
-            ),
-            axis=1,
-        )
-        self.master_customer.apply(
-            lambda _x: self.hierarchy_data_tree(
-                _x.to_dict(), self.customer_col_hierarchy, self.customer_map
-            ),
-            axis=1,
-        )
-        self.master_time.apply(
-            lambda _x: self.hierarchy_data_tree(
-                _x.to_dict(), self.time_col_hierarchy, self.time_map
-            ),
-            axis=1,
+        self.item_hierarchy = HierarchyIndex(self.master_item, self.item_col_hierarchy)
+        self.customer_hierarchy = HierarchyIndex(
+            self.master_customer, self.customer_col_hierarchy
         )
-        self.master_location.apply(
-            lambda _x: self.hierarchy_data_tree(
-                _x.to_dict(), self.location_col_hierarchy, self.location_map
-            ),
-            axis=1,
+        self.time_hierarchy = HierarchyIndex(self.master_time, self.time_col_hierarchy)
+        self.location_hierarchy = HierarchyIndex(
+            self.master_location, self.location_col_hierarchy
         )
         del self.master_location
         del self.master_customer
         del self.master_item
 
-    @staticmethod
-    def hierarchy_data_tree(_data, _colHierarchy, _result, _header=0):
-        _result[_data[_colHierarchy[_header]]] = {
-            key: _data[value] for key, value in _colHierarchy.items() if key != 0
-        }
-        for key, value in _colHierarchy.items():
-            if key != 0:
-                if key in _result:
-                    if _data[value] in _result[key]:
-                        _result[key][_data[value]].append(_data[_colHierarchy[_header]])
-                    else:
-                        _result[key][_data[value]] = [_data[_colHierarchy[_header]]]
-                else:
-                    _result[key] = {_data[value]: [_data[_colHierarchy[_header]]]}
-
     def run_graph_netting(self):
         print(">> Graph Netting")
         # Create Order Consumption Tuples.
@@ -1360,9 +2635,12 @@ class DemandNetting:
         self.past_orders = self.past_orders.dropna(subset=[self.DEMAND_TYPE])
 
     def get_demand_types(self):
-
-        output_forecast_types: DataFrame = DataFrame()
-        output_demand_types: DataFrame = DataFrame()
+        """
+        Order and forecast demand type rows. COM/UNF/NEW quantities are computed for all orders at once
+        and the pieces of every stream are concatenated once at the end.
+        """
+        orderPieces: list = []
+        forecastPieces: list = []
 
         mergeGrain = []
         filterGrain = [
@@ -1398,31 +2676,31 @@ class DemandNetting:
 
         out_grains = [x for x in self.in_orders.columns if ".[" in x]
         if self.split_demand_type:
-            for os, os_details in self.os_map.items():
-                os_order = self.in_orders[self.in_orders[self.order_type] == os]
-                os_order["COM"] = os_order[self.orderCoverByRTF]
-                os_order["UNF"] = os_order[
-                    [self.orderNotCoverByRTF, self.remaining_order_after_forecast]
-                ].min(axis=1)
-                os_order["NEW"] = (
-                        os_order[self.open_order_qty] - os_order["COM"] - os_order["UNF"]
-                )
-                for index, os_detail in enumerate(os_details):
+            comQty = self.in_orders[self.orderCoverByRTF].to_numpy(dtype=float)
+            # Row wise DataFrame.min skips NaN, as fmin does.
+            unfQty = fmin(
+                self.in_orders[self.orderNotCoverByRTF].to_numpy(dtype=float),
+                self.in_orders[self.remaining_order_after_forecast].to_numpy(dtype=float),
+            )
+            newQty = self.in_orders[self.open_order_qty].to_numpy(dtype=float) - comQty - unfQty
+            typeRows = self.in_orders.groupby(self.order_type, sort=False).indices
+            orderGrains = self.in_orders[out_grains]
+            for order_stream, os_details in self.os_map.items():
+                rows = typeRows.get(order_stream, empty(0, dtype=int64))
+                for os_detail in os_details:
                     self.forecast_qty = os_detail[self.os_forecast]
                     fs_detail = self.fs_map[self.forecast_qty]
                     self.forecast_consumed = fs_detail[self.fs_forecast_consumed]
-                    unf = os_detail[self.os_unf_order]
-                    com = os_detail[self.os_com_order]
-                    new = os_detail[self.os_new_order]
-                    last = False
-                    if index == len(os_details) - 1:
-                        last = True
-                    out_piece = self.divide_demand(
-                        os_order, out_grains, unf, com, new, last
-                    )
-                    output_demand_types = concat(
-                        [output_demand_types, out_piece], ignore_index=True
+                orderPieces.extend(
+                    self.divide_demand(
+                        orderGrains.take(rows),
+                        rows,
+                        os_details,
+                        comQty[rows],
+                        newQty[rows],
+                        unfQty[rows],
                     )
+                )
         else:
             out_grains = out_grains + [self.DEMAND_TYPE, self.netted_demand_qty]
 
@@ -1431,42 +2709,31 @@ class DemandNetting:
             ]
 
             if not os_order.empty:
-                os_order.loc[os_order[self.orderCoverByRTF] > 0, self.DEMAND_TYPE] = (
-                    Config.COM_ORDER
-                )
-                os_order.loc[
-                    (
-                            (os_order[self.orderCoverByRTF] == 0)
-                            & (os_order[self.order_consumed_by_all_forecast] > 0)
-                    ),
-                    self.DEMAND_TYPE,
-                ] = Config.NEW_ORDER
-                os_order.loc[
-                    (
-                            (os_order[self.orderCoverByRTF] == 0)
-                            & (os_order[self.order_consumed_by_all_forecast] == 0)
-                    ),
-                    self.DEMAND_TYPE,
-                ] = Config.UNF_ORDER
-
-                os_order[self.netted_demand_qty] = os_order[self.open_order_qty]
-                os_order = os_order[out_grains]
+                coverByRTF = os_order[self.orderCoverByRTF].to_numpy()
+                consumedByForecast = os_order[self.order_consumed_by_all_forecast].to_numpy()
+                demandType = full(len(os_order), None, dtype=object)
+                demandType[coverByRTF > 0] = Config.COM_ORDER
+                demandType[(coverByRTF == 0) & (consumedByForecast > 0)] = Config.NEW_ORDER
+                demandType[(coverByRTF == 0) & (consumedByForecast == 0)] = Config.UNF_ORDER
+                os_order = os_order.assign(
+                    **{
+                        self.DEMAND_TYPE: demandType,
+                        self.netted_demand_qty: os_order[self.open_order_qty],
+                    }
+                )[out_grains]
             else:
                 os_order = DataFrame(columns=out_grains)
 
-            output_demand_types = concat(
-                [output_demand_types, os_order], ignore_index=True
-            )
+            orderPieces.append(os_order)
 
         # Dividing the forecast
-
+        demandRows = self.in_orders.groupby(self.DEMAND_ID, sort=False).indices
         for fs, fs_detail in self.fs_map.items():
             forecast_id = fs_detail[self.fs_demand_id]
 
-            fs_order = self.in_orders[self.in_orders[self.DEMAND_ID] == forecast_id]
-
-            fs_order[self.DEMAND_TYPE] = None
-            fs_order[self.netted_demand_qty] = 0
+            fs_order = self.in_orders.take(
+                demandRows.get(forecast_id, empty(0, dtype=int64))
+            ).assign(**{self.DEMAND_TYPE: None, self.netted_demand_qty: 0})
 
             if self.use_aggregate and not self.output_at_aggregated_level:
                 self.forecast_remaining = fs_detail[self.fs_forecast_remaining]
@@ -1501,69 +2768,60 @@ class DemandNetting:
                 com = Config.COM_FCST
                 new = Config.NEW_FCST
 
-            com_out = fs_order[out_grains]
-            new_out = fs_order[out_grains]
-
-            com_out[self.DEMAND_TYPE] = com
-            new_out[self.DEMAND_TYPE] = new
-
-            com_out[self.netted_demand_qty] = fs_order[self.orderCoverByRTF]
-            new_out[self.netted_demand_qty] = fs_order[self.orderNotCoverByRTF]
-
-            com_out = com_out[com_out[self.netted_demand_qty] > 0]
-            new_out = new_out[new_out[self.netted_demand_qty] > 0]
-
-            output_forecast_types = concat(
-                [output_forecast_types, com_out, new_out], ignore_index=True
+            comQty = fs_order[self.orderCoverByRTF].to_numpy()
+            newQty = fs_order[self.orderNotCoverByRTF].to_numpy()
+            forecastPieces.append(
+                fs_order.loc[comQty > 0, out_grains].assign(
+                    **{self.DEMAND_TYPE: com, self.netted_demand_qty: comQty[comQty > 0]}
+                )
+            )
+            forecastPieces.append(
+                fs_order.loc[newQty > 0, out_grains].assign(
+                    **{self.DEMAND_TYPE: new, self.netted_demand_qty: newQty[newQty > 0]}
+                )
             )
 
+        output_demand_types = (
+            concat(orderPieces, ignore_index=True) if orderPieces else DataFrame()
+        )
+        output_forecast_types = (
+            concat(forecastPieces, ignore_index=True) if forecastPieces else DataFrame()
+        )
         return output_demand_types, output_forecast_types
 
-    def divide_demand(
-            self,
-            os_order,
-            out_grains,
-            unf,
-            com,
-            new,
-            is_last=False,
-    ):
-        output_demand_types: DataFrame = DataFrame()
-        com_out = os_order[out_grains]
-        new_out = os_order[out_grains]
-        com_out[self.DEMAND_TYPE] = com
-        new_out[self.DEMAND_TYPE] = new
-        if is_last:
-            com_out[self.netted_demand_qty] = os_order["COM"]
-            new_out[self.netted_demand_qty] = os_order["NEW"]
-
-            unf_out = os_order[out_grains]
-            unf_out[self.DEMAND_TYPE] = unf
-            unf_out[self.netted_demand_qty] = os_order["UNF"]
-            unf_out = unf_out[unf_out[self.netted_demand_qty] > 0]
-
-            output_demand_types = concat(
-                [output_demand_types, unf_out], ignore_index=True
+    def divide_demand(self, _grains: DataFrame, _rows, _osDetails: list, _com, _new, _unf) -> list:
+        """
+        Demand type pieces of an order stream. Every forecast stream but the last takes COM and then NEW
+        up to what it consumed of the orders (rows of a streams x orders matrix); the last one gets what
+        is left, together with UNF. fmin skips NaN like the row wise DataFrame.min it replaces.
+        """
+        forecastConsumed = empty((len(_osDetails) - 1, len(_rows)), dtype=float)
+        for streamPos, os_detail in enumerate(_osDetails[:-1]):
+            consumedColumn = self.fs_map[os_detail[self.os_forecast]][self.fs_forecast_consumed]
+            forecastConsumed[streamPos] = self.in_orders[consumedColumn].to_numpy(dtype=float)[_rows]
+        com = _com.copy()
+        new = _new.copy()
+
+        def piece(_qty, _demandType):
+            positive = _qty > 0
+            return _grains[positive].assign(
+                **{self.DEMAND_TYPE: _demandType, self.netted_demand_qty: _qty[positive]}
             )
-        else:
-            com_out[self.netted_demand_qty] = os_order[
-                [self.forecast_consumed, "COM"]
-            ].min(axis=1)
-            os_order[self.forecast_consumed] -= com_out[self.netted_demand_qty]
-            os_order["COM"] -= com_out[self.netted_demand_qty]
 
-            new_out[self.netted_demand_qty] = os_order[
-                [self.forecast_consumed, "NEW"]
-            ].min(axis=1)
-            os_order[self.forecast_consumed] -= new_out[self.netted_demand_qty]
-            os_order["NEW"] -= new_out[self.netted_demand_qty]
-        com_out = com_out[com_out[self.netted_demand_qty] > 0]
-        new_out = new_out[new_out[self.netted_demand_qty] > 0]
-        output_demand_types = concat(
-            [output_demand_types, com_out, new_out], ignore_index=True
-        )
-
-        return output_demand_types
+        pieces: list = []
+        for os_detail, consumed in zip(_osDetails[:-1], forecastConsumed):
+            comTaken = fmin(consumed, com)
+            consumed -= comTaken
+            com -= comTaken
+            newTaken = fmin(consumed, new)
+            new -= newTaken
+            pieces.append(piece(comTaken, os_detail[self.os_com_order]))
+            pieces.append(piece(newTaken, os_detail[self.os_new_order]))
+        lastDetail = _osDetails[-1]
+        pieces.append(piece(_unf, lastDetail[self.os_unf_order]))
+        pieces.append(piece(com, lastDetail[self.os_com_order]))
+        pieces.append(piece(new, lastDetail[self.os_new_order]))
+        return pieces
 
     def create_consumption_tuples_from_graph(self):
         self.plugin_log(
@@ -1588,136 +2846,202 @@ class DemandNetting:
                     self.to_location = colHeader
                 elif cust_dim in colHeader:
                     self.to_customer = colHeader
-        tempGraph = self.in_orderForecastMapGraph[
-            self.in_orderForecastMapGraph[self.graph_forecast_association].values == 1
-            ]
-        tempGraph.sort_values(
-            by=[
-                self.from_item,
-                self.from_location,
-                self.from_customer,
-                self.graph_priority,
-            ],
-            inplace=True,
+        self.association_graph = AssociationGraph(
+            self.in_orderForecastMapGraph,
+            [self.from_item, self.from_location, self.from_customer],
+            [self.to_item, self.to_location, self.to_customer],
+            self.graph_priority,
         )
+        self.set_graph_association(self.graph_forecast_association)
 
-        self.order_forecast_map_hash: dict = {}
-        vectorize(self.create_order_forecast_map_hash, otypes=[str])(
-            tempGraph[self.from_item],
-            tempGraph[self.from_location],
-            tempGraph[self.from_customer],
-            tempGraph[self.to_item],
-            tempGraph[self.to_location],
-            tempGraph[self.to_customer],
-            self.order_forecast_map_hash,
-        )
+    def set_graph_association(self, _association: str):
+        """Select the association measure of the graph, the candidates are compiled on first use."""
+        self.graph_association = _association
+        self.graph_offsets = None
+        self.graph_row_keys = None
+        self.forecast_time_index = None
 
-    @staticmethod
-    def create_order_forecast_map_hash(
-            _fromItem, _fromLoc, _fromSales, _toItem, _toLoc, _toSales, _result
-    ):
-        if (_fromItem, _fromLoc, _fromSales) in _result:
-            _result[(_fromItem, _fromLoc, _fromSales)].append(
-                (_toItem, _toLoc, _toSales)
+    def get_graph_candidates(self, _key):
+        """
+        Forecast indices an order with the given consumption key can consume in graph mode: for every
+        associated forecast key in priority order, the current bucket, the backward buckets and the
+        forward buckets, as get_backward_time/get_forward_time order them.
+        """
+        if self.forecast_time_index is None:
+            self.forecast_time_index = ForecastTimeIndex(
+                self.forecastToIndexMap, self.time_bucket_position
             )
-        else:
-            _result[(_fromItem, _fromLoc, _fromSales)] = [(_toItem, _toLoc, _toSales)]
-        return ""
+            self.graph_offsets, self.graph_row_keys = self.association_graph.adjacency(
+                self.graph_association, self.forecast_time_index.key_codes
+            )
+        fItem, fLoc, fSales, fTime, backward, forward = _key
+        fromCode = self.association_graph.from_codes.get((fItem, fLoc, fSales), None)
+        if fromCode is None:
+            return empty(0, dtype=int64)
+        toKeys = self.graph_row_keys[
+                 self.graph_offsets[fromCode]: self.graph_offsets[fromCode + 1]
+                 ]
+        curTimeIndex = self.time_bucket_position.get(fTime, None)
+        if curTimeIndex is None:
+            if len(toKeys) > 0 and (backward > 0 or forward > 0):
+                # Raises like get_backward_time/get_forward_time for an unknown bucket.
+                self.get_time_position(fTime)
+            return empty(0, dtype=int64)
+        return self.forecast_time_index.window_indices(
+            toKeys[toKeys >= 0],
+            curTimeIndex,
+            max(backward, 0),
+            max(forward, 0),
+            self.enable_backward_before_current,
+        )
 
     def create_order_consumption_tuples(self):
-        self.order_consumption_tuples = {}
+        self.order_consumption_tuples = ConsumptionTupleCache(self.tuple_cache_size)
         self.plugin_log("Creating Consumptions Tuple.")
         self.plugin_log("Creating Order Tuples.")
         # print(self.Order)
+        source = self.add_recipe_source(
+            self.in_orders,
+            (self.UPWARD_TIME, self.UPWARD_CUSTOMER, self.UPWARD_ITEM, self.UPWARD_LOCATION),
+        )
+        positions = iter(range(len(self.in_orders)))
         self.in_orders.apply(
-            lambda _x: self.create_tuples_for_order(_x.to_dict()), axis=1
+            lambda _x: self.create_tuples_for_order(_x.to_dict(), source, next(positions)),
+            axis=1,
         )
 
     def create_forecast_consumption_tuples(self):
         self.plugin_log("Creating Consumptions Tuple.")
         self.plugin_log("Creating Forecast Tuples.")
+        source = self.add_recipe_source(
+            self.in_forecasts,
+            (self.F_UPWARD_TIME, self.F_UPWARD_CUSTOMER, self.F_UPWARD_ITEM, self.F_UPWARD_LOCATION),
+        )
+        positions = iter(range(len(self.in_forecasts)))
         self.in_forecasts.apply(
-            lambda _x: self.create_tuples_for_forecast(_x.to_dict()), axis=1
+            lambda _x: self.create_tuples_for_forecast(_x.to_dict(), source, next(positions)),
+            axis=1,
         )
+        self.log_tuple_cache_stats()
 
-    def create_tuples_for_order(self, _data):
+    def create_tuples_for_order(self, _data, _source=None, _position=None):
         oItem = _data[self.ITEM]
         oLocation = _data[self.LOCATION]
         oTime = _data[self.TIME]
         oSales = _data[self.CUSTOMER]
         backward = int(_data[self.BACKWARD_BUCKETS])
         forward = int(_data[self.FORWARD_BUCKETS])
-        if (
-                oItem,
-                oLocation,
-                oSales,
-                oTime,
-                backward,
-                forward,
-        ) not in self.order_consumption_tuples:
-            if self.no_bucket_flag:
-                self.order_consumption_tuples[
-                    (oItem, oLocation, oSales, oTime, backward, forward)
-                ] = [
-                    (
-                        _data[self.f_item],
-                        _data[self.f_location],
-                        _data[self.f_customer],
-                        _data[self.f_time],
-                    )
-                ]
-            else:
-                self.order_consumption_tuples[
-                    (oItem, oLocation, oSales, oTime, backward, forward)
-                ] = self.create_tuples(
-                    _orderData=_data,
-                    _backward=backward,
-                    _forward=forward,
-                    _time_level=int(_data[self.UPWARD_TIME]),
-                    _sales_level=int(_data[self.UPWARD_CUSTOMER]),
-                    _item_level=int(_data[self.UPWARD_ITEM]),
-                    _loc_level=int(_data[self.UPWARD_LOCATION]),
-                )
-
-    def create_tuples_for_forecast(self, _data):
+        key = (oItem, oLocation, oSales, oTime, backward, forward)
+        if key not in self.order_consumption_tuples:
+            levels = None
+            if not self.no_bucket_flag:
+                levels = (
+                    int(_data[self.UPWARD_TIME]),
+                    int(_data[self.UPWARD_CUSTOMER]),
+                    int(_data[self.UPWARD_ITEM]),
+                    int(_data[self.UPWARD_LOCATION]),
+                )
+            self.add_consumption_tuples(key, _data, levels, _source, _position)
+
+    def create_tuples_for_forecast(self, _data, _source=None, _position=None):
         fItem = _data[self.f_item]
         fLocation = _data[self.f_location]
         fSales = _data[self.f_customer]
         fTime = _data[self.f_time]
         backward = int(_data[self.F_BACKWARD_BUCKETS])
         forward = int(_data[self.F_FORWARD_BUCKETS])
+        key = (fItem, fLocation, fSales, fTime, backward, forward)
+        if key not in self.order_consumption_tuples:
+            levels = None
+            if not self.no_bucket_flag:
+                levels = (
+                    int(_data[self.F_UPWARD_TIME]),
+                    int(_data[self.F_UPWARD_CUSTOMER]),
+                    int(_data[self.F_UPWARD_ITEM]),
+                    int(_data[self.F_UPWARD_LOCATION]),
+                )
+            self.add_consumption_tuples(key, _data, levels, _source, _position)
 
-        if (
-                fItem,
-                fLocation,
-                fSales,
-                fTime,
-                backward,
-                forward,
-        ) not in self.order_consumption_tuples:
-            if self.no_bucket_flag:
-                self.order_consumption_tuples[
-                    (fItem, fLocation, fSales, fTime, backward, forward)
-                ] = [
-                    (
-                        _data[self.f_item],
-                        _data[self.f_location],
-                        _data[self.f_customer],
-                        _data[self.f_time],
-                    )
-                ]
-            else:
-                self.order_consumption_tuples[
-                    (fItem, fLocation, fSales, fTime, backward, forward)
-                ] = self.create_tuples(
-                    _orderData=_data,
-                    _backward=backward,
-                    _forward=forward,
-                    _time_level=int(_data[self.F_UPWARD_TIME]),
-                    _sales_level=int(_data[self.F_UPWARD_CUSTOMER]),
-                    _item_level=int(_data[self.F_UPWARD_ITEM]),
-                    _loc_level=int(_data[self.F_UPWARD_LOCATION]),
+    def add_recipe_source(self, _frame, _levelColumns):
+        """
+        Copy the columns create_tuples reads from _frame into the tuple cache as a recipe source, when
+        the cache has a budget and may have to regenerate evicted entries. Values are taken as object
+        arrays, so a row of the source holds the same Python values as the row dict of apply.
+        """
+        if self.order_consumption_tuples.budget <= 0:
+            return None
+        columns = {
+            column: _frame[column].to_numpy(dtype=object, copy=True)
+            for column in dict.fromkeys(
+                (
+                    self.f_item,
+                    self.f_location,
+                    self.f_customer,
+                    self.f_time,
+                    self.ITEM,
+                    self.LOCATION,
+                    self.CUSTOMER,
+                    self.TIME,
+                    self.DEMAND_ID,
                 )
+                + (() if self.no_bucket_flag else _levelColumns)
+            )
+            if column in _frame.columns
+        }
+        return self.order_consumption_tuples.add_source(
+            columns, None if self.no_bucket_flag else _levelColumns
+        )
+
+    def add_consumption_tuples(self, _key, _data, _levels, _source=None, _position=None):
+        """
+        Create and cache the consumption tuples of _key. The recipe is the row position of _data in its
+        recipe source, so an evicted entry can be regenerated exactly as its first creator built it.
+        """
+        recipe = None if _source is None else (_source, _position)
+        self.order_consumption_tuples.add(
+            _key, self.build_consumption_tuples(_data, _key, _levels), recipe
+        )
+
+    def build_consumption_tuples(self, _data, _key, _levels) -> list:
+        if self.no_bucket_flag:
+            return [
+                (
+                    _data[self.f_item],
+                    _data[self.f_location],
+                    _data[self.f_customer],
+                    _data[self.f_time],
+                )
+            ]
+        return self.create_tuples(
+            _orderData=_data,
+            _backward=_key[4],
+            _forward=_key[5],
+            _time_level=_levels[0],
+            _sales_level=_levels[1],
+            _item_level=_levels[2],
+            _loc_level=_levels[3],
+        )
+
+    def get_consumption_tuples(self, _key, _default=None):
+        """Cached consumption tuples of _key, regenerated from its recipe if the entry was evicted."""
+        consumptionTuples = self.order_consumption_tuples.get(_key, None)
+        if consumptionTuples is None:
+            recipe = self.order_consumption_tuples.recipes.get(_key, None)
+            if recipe is None:
+                return _default
+            data, levels = self.order_consumption_tuples.recipe_row(recipe)
+            consumptionTuples = self.build_consumption_tuples(data, _key, levels)
+            self.order_consumption_tuples.add(_key, consumptionTuples, recipe)
+            self.order_consumption_tuples.regenerations += 1
+        return consumptionTuples
+
+    def log_tuple_cache_stats(self):
+        cache = self.order_consumption_tuples
+        self.plugin_log(
+            f"Consumption Tuple Cache: entries={len(cache)}, size={cache.used / (1024 * 1024):.1f}MB, "
+            f"hits={cache.hits}, misses={cache.misses}, evictions={cache.evictions}, "
+            f"regenerations={cache.regenerations}"
+        )
 
     def create_tuples(
             self,
@@ -1768,66 +3092,30 @@ class DemandNetting:
             forward_buckets_values = self.get_forward_time(fTime, _forward)
         if self.enable_time_hierarchy:
             upward_time_values = self.get_siblings(
-                self.time_map,
-                _time_level,
-                self.unique_forecast_time,
-                _orderData[self.TIME],
+                "Time", _time_level, _orderData[self.TIME]
             )
         if _item_level > 0:
             upward_item_values = self.get_siblings(
-                self.item_map,
-                _item_level,
-                self.unique_forecast_item,
-                _orderData[self.ITEM],
+                "Item", _item_level, _orderData[self.ITEM]
             )
         if _loc_level > 0:
             upward_location_values = self.get_siblings(
-                self.location_map,
-                _loc_level,
-                self.unique_forecast_location,
-                _orderData[self.LOCATION],
+                "Location", _loc_level, _orderData[self.LOCATION]
             )
         if _sales_level > 0:
             upward_customer_values = self.get_siblings(
-                self.customer_map,
-                _sales_level,
-                self.unique_forecast_customer,
-                _orderData[self.CUSTOMER],
-            )
-        hierarchicalConsumptionOrder = self.parameters[Config.DN_H_CONSUMPTION_ORDER]
-        consumptionOrder = self.parameters[Config.DN_CONSUMPTION_ORDER]
-        if self.enable_time_hierarchy:
-            chars = "ILST"
-            validHierarchyConsOrder = set(
-                ["".join(perm) for perm in permutations(chars, 4)]
+                "Sales Domain", _sales_level, _orderData[self.CUSTOMER]
             )
-            if hierarchicalConsumptionOrder not in validHierarchyConsOrder:
-                raise PluginException(
-                    f"Incorrect {Config.DN_H_CONSUMPTION_ORDER}: {hierarchicalConsumptionOrder}. Exiting!"
-                )
+        plan = self.get_consumption_plan()
+        if plan.hierarchical:
             data_map = {
                 "I": upward_item_values,
                 "L": upward_location_values,
                 "S": upward_customer_values,
                 "T": upward_time_values,
             }
-            consumption_tuple = self.form_consumption_tuples(
-                data_map, hierarchicalConsumptionOrder, "T"
-            )
 
         else:
-            chars = "BILSF"
-            validConsOrder = set(["".join(perm) for perm in permutations(chars, 5)])
-            # Making sure Backward is done before Forward
-            validConsOrder = {
-                perm for perm in validConsOrder if perm.index("B") < perm.index("F")
-            }
-            if consumptionOrder not in validConsOrder:
-                raise PluginException(
-                    f"Incorrect {Config.DN_CONSUMPTION_ORDER}: {consumptionOrder}. Exiting!"
-                )
-            backwardConsOrder = consumptionOrder.replace("F", "")
-            forwardConsOrder = consumptionOrder.replace("B", "")
             if self.enable_backward_before_current:
                 backward_buckets_values = backward_buckets_values + [
                     upward_time_values[0]
@@ -1836,25 +3124,18 @@ class DemandNetting:
                 backward_buckets_values = [
                                               upward_time_values[0]
                                           ] + backward_buckets_values
-            backward_data_map = {
+            data_map = {
                 "I": upward_item_values,
                 "L": upward_location_values,
                 "S": upward_customer_values,
                 "B": backward_buckets_values,
-            }
-            # print(">>>", backwardConsOrder)
-            consumption_tuple = self.form_consumption_tuples(
-                backward_data_map, backwardConsOrder, "B"
-            )
-            forward_data_map = {
-                "I": upward_item_values,
-                "L": upward_location_values,
-                "S": upward_customer_values,
                 "F": forward_buckets_values,
             }
-            consumption_tuple += self.form_consumption_tuples(
-                forward_data_map, forwardConsOrder, "F"
-            )
+
+        if self.lazy_tuples:
+            # Tuples are generated while consuming, their count is not known up front.
+            return LazyConsumptionTuples(plan, data_map)
+        consumption_tuple = plan.form_tuples(data_map)
 
         if len(consumption_tuple) >= 10000 and self.tuple_size_warning_counter < 10:
             self.plugin_log(
@@ -1870,78 +3151,109 @@ class DemandNetting:
 
         return consumption_tuple
 
+    def get_consumption_plan(self):
+        """
+        Compile the consumption order on first use, so an invalid parameter is still raised by the
+        first tuple creation.
+        """
+        if self.consumption_plan is None:
+            if self.enable_time_hierarchy:
+                self.consumption_plan = ConsumptionPlan(
+                    self.parameters[Config.DN_H_CONSUMPTION_ORDER], True
+                )
+            else:
+                self.consumption_plan = ConsumptionPlan(
+                    self.parameters[Config.DN_CONSUMPTION_ORDER], False
+                )
+        return self.consumption_plan
+
+    def get_time_position(self, _fTime) -> int:
+        curTimeIndex = self.time_bucket_position.get(_fTime, None)
+        if curTimeIndex is None:
+            raise ValueError(f"{_fTime!r} is not in list")
+        return curTimeIndex
+
     def get_backward_time(self, _fTime, _backward) -> list:
-        result = []
-        curTimeIndex = self.all_time_buckets.index(_fTime)
-        for backwardBucket in range(1, int(_backward) + 1):
-            backwardIndex = curTimeIndex - backwardBucket
-            if backwardIndex < 0:
-                continue
-            timeBucket = self.all_time_buckets[backwardIndex]
-            result.append(timeBucket)
-        if self.enable_backward_before_current:
-            result = result[::-1]
+        """
+        Backward buckets of _fTime, nearest first (farthest first with enable_backward_before_current).
+        Windows are cached per (bucket, buckets, direction), the returned list must not be modified.
+        """
+        _backward = int(_backward)
+        key = (_fTime, _backward, "B")
+        result = self.time_window_cache.get(key, None)
+        if result is None:
+            curTimeIndex = self.get_time_position(_fTime)
+            result = self.all_time_buckets[max(curTimeIndex - _backward, 0): curTimeIndex]
+            if not self.enable_backward_before_current:
+                result = result[::-1]
+            self.time_window_cache[key] = result
         return result
 
     def get_forward_time(self, _fTime, _forward) -> list:
-        result = []
-        curTimeIndex = self.all_time_buckets.index(_fTime)
-        for forwardBucket in range(1, int(_forward) + 1):
-            forwardIndex = curTimeIndex + forwardBucket
-            if forwardIndex >= len(self.all_time_buckets):
-                continue
-            timeBucket = self.all_time_buckets[forwardIndex]
-            result.append(timeBucket)
+        """Forward buckets of _fTime, nearest first. The returned list is cached and must not be modified."""
+        _forward = int(_forward)
+        key = (_fTime, _forward, "F")
+        result = self.time_window_cache.get(key, None)
+        if result is None:
+            curTimeIndex = self.get_time_position(_fTime)
+            result = self.all_time_buckets[
+                curTimeIndex + 1: curTimeIndex + 1 + max(_forward, 0)
+            ]
+            self.time_window_cache[key] = result
         return result
 
-    @staticmethod
-    def get_siblings(_map, _level, _uniqueValues, _orderValue) -> list:
+    def get_sibling_source(self, _dimension: str):
+        return {
+            "Item": (self.item_hierarchy, self.unique_forecast_item),
+            "Location": (self.location_hierarchy, self.unique_forecast_location),
+            "Sales Domain": (self.customer_hierarchy, self.unique_forecast_customer),
+            "Time": (self.time_hierarchy, self.unique_forecast_time),
+        }[_dimension]
+
+    def get_siblings(self, _dimension: str, _level: int, _orderValue) -> list:
+        """
+        _orderValue followed by its siblings up to _level that are present in the forecasts or RTFs,
+        without repeats. Memoized per (dimension, value, level), the returned list must not be modified.
+        """
+        key = (_dimension, _orderValue, _level)
+        result = self.sibling_cache.get(key, None)
+        if result is not None:
+            return result
+        hierarchy, uniqueValues = self.get_sibling_source(_dimension)
         result = [_orderValue]
         seen_values = set(result)
 
+        leafPosition = hierarchy.leaf_positions[_orderValue]
         for i in range(1, _level + 1):
-            hierarchyCol = _map[_orderValue].get(i, None)
-            if hierarchyCol is None:
+            if i not in hierarchy.parent_codes:
                 break
 
             siblings = [
                 value
-                for value in _map[i].get(hierarchyCol, [])
-                if value in _uniqueValues and value not in seen_values
+                for value in self.get_present_children(
+                    _dimension, hierarchy, uniqueValues, i, leafPosition
+                )
+                if value not in seen_values
             ]
             result.extend(siblings)
             seen_values.update(siblings)
 
+        self.sibling_cache[key] = result
         return result
 
-    @staticmethod
-    def form_consumption_tuples(
-            data_map,
-            consumption_order,
-            time_tuple_value="T",
-    ) -> list:
-        result = []
-        seen_tuple = set()
-        tuple_dict = {"I": None, "L": None, "S": None, "B": None, "T": None, "F": None}
-        for fourth in data_map[consumption_order[3]]:
-            for third in data_map[consumption_order[2]]:
-                for second in data_map[consumption_order[1]]:
-                    for first in data_map[consumption_order[0]]:
-                        tuple_dict[consumption_order[0]] = first
-                        tuple_dict[consumption_order[1]] = second
-                        tuple_dict[consumption_order[2]] = third
-                        tuple_dict[consumption_order[3]] = fourth
-                        reordered_vals = (
-                            tuple_dict["I"],
-                            tuple_dict["L"],
-                            tuple_dict["S"],
-                            tuple_dict[time_tuple_value],
-                        )
-                        # print(reordered_vals)
-                        if reordered_vals not in seen_tuple:
-                            seen_tuple.add(reordered_vals)
-                            result.append(reordered_vals)
-        return result
+    def get_present_children(self, _dimension, _hierarchy, _uniqueValues, _level, _leafPosition) -> list:
+        """Children of the level _level parent of a leaf that are present in _uniqueValues, shared by all its leaves."""
+        parent = _hierarchy.parent_codes[_level][_leafPosition]
+        key = (_dimension, _level, parent)
+        children = self.present_children_cache.get(key, None)
+        if children is None:
+            children = [
+                value
+                for value in _hierarchy.children(_level, _leafPosition)
+                if value in _uniqueValues
+            ]
+            self.present_children_cache[key] = children
+        return children
 
     def set_order_priority(self, _isForecast=False):
         orderPriority = []
@@ -1956,18 +3268,24 @@ class DemandNetting:
         if order_time_priority in list(orderHeaders):
             self.in_orders.drop(columns=order_time_priority, inplace=True)
         timeOrderHeader = self.f_time if _isForecast else self.TIME
-        curTimePriorityData = (
-            self.time_priority_data[[timeOrderHeader, self.time_priority]]
-            .groupby(timeOrderHeader, as_index=False)
-            .agg("max")
-        )
+        curTimePriorityData = self.time_priority_cache.get(timeOrderHeader, None)
+        if curTimePriorityData is None:
+            curTimePriorityData = (
+                self.time_priority_data[[timeOrderHeader, self.time_priority]]
+                .groupby(timeOrderHeader, as_index=False)
+                .agg("max")
+            )
+            self.time_priority_cache[timeOrderHeader] = curTimePriorityData
 
-        self.in_orders = merge(
-            self.in_orders, curTimePriorityData, on=timeOrderHeader, how="left"
-        )
-        self.in_orders.rename(
-            columns={self.time_priority: order_time_priority}, inplace=True
+        # Left merge of the time priority: rows keep their order and are relabelled from 0.
+        timeRows = Index(curTimePriorityData[timeOrderHeader]).get_indexer(
+            self.in_orders[timeOrderHeader]
         )
+        timePriority = curTimePriorityData[self.time_priority].to_numpy().take(timeRows)
+        if (timeRows < 0).any():
+            timePriority = where(timeRows < 0, float("nan"), timePriority)
+        self.in_orders = self.in_orders.reset_index(drop=True)
+        self.in_orders[order_time_priority] = timePriority
         # CALCULATE ORDER PRIORITY BASED ON MEASURE GIVEN AND TIE-BREAKER (Demand ID).
         orderPriority.append(order_time_priority)
         orderPriority.append(self.DEMAND_ID)
@@ -1991,7 +3309,31 @@ class DemandNetting:
             orderPriority = orderPriority + self.forecast_grain[:2]
 
         self.plugin_log(f"Sorting ({self.order_qty}) via: {orderPriority}")
-        self.in_orders.sort_values(by=orderPriority, inplace=True)
+        # Same order as a (stable, NaN last) sort_values over the columns.
+        sortKeys = [self.get_priority_codes(column) for column in orderPriority]
+        self.in_orders = self.in_orders.take(lexsort(sortKeys[::-1]))
+
+    def get_priority_codes(self, _column: str):
+        """
+        Sort key of a set_order_priority column: numbers as they are, other values as their position in
+        a cached table of sorted values (missing values last). The table only grows, with the values of
+        rows appended since, e.g. the forecast rows of the RTF phase.
+        """
+        values = self.in_orders[_column].to_numpy()
+        if values.dtype.kind in "iufb":
+            return values
+        table = self.priority_code_tables.get(_column, None)
+        if table is None:
+            table = Index([])
+        codes = table.get_indexer(values)
+        missing = isna(values)
+        added = (codes < 0) & ~missing
+        if added.any():
+            table = table.append(Index(unique(values[added]))).sort_values()
+            codes = table.get_indexer(values)
+        self.priority_code_tables[_column] = table
+        codes[missing] = len(table)
+        return codes
 
     def net_order_against_forecast(self):
         self.generate_stream_hash()
@@ -2015,26 +3357,29 @@ class DemandNetting:
 
         self.in_orders[self.remaining_order_after_forecast] = self.in_orders[self.order_qty]
 
-        for os, os_details in self.os_map.items():
-            for os_detail in os_details:
-                if os not in self.past_order_hash:
-                    self.past_order_hash[os] = os_detail[self.os_past_order_dt]
-                self.order_consumed = os_detail[self.os_order_consumed]
-                self.order_remaining = os_detail[self.os_order_remaining]
-                self.forecast_qty = os_detail[self.os_forecast]
-                fs_detail = self.fs_map[self.forecast_qty]
-                self.forecast_consumed = fs_detail[self.fs_forecast_consumed]
-                self.forecast_remaining = fs_detail[self.fs_forecast_remaining]
-                self.in_forecasts[self.forecast_qty].fillna(0, inplace=True)
-                self.empty_forecast_indices = {}
-                self.pegging = []
-                self.run_netting(os, _excludeOrderMeasure=self.EXCLUDE_NETTING)
-                self.orders_seen.add(self.order_consumed)
-                self.orders_seen.add(self.order_remaining)
-                self.forecasts_seen.add(self.forecast_consumed)
-
-                if self.pegging_flag:
-                    self.append_to_final_pegging(self.pegging)
+        if self.use_multi_stream:
+            self.net_order_streams()
+        else:
+            for order_stream, os_details in self.os_map.items():
+                for os_detail in os_details:
+                    if order_stream not in self.past_order_hash:
+                        self.past_order_hash[order_stream] = os_detail[self.os_past_order_dt]
+                    self.order_consumed = os_detail[self.os_order_consumed]
+                    self.order_remaining = os_detail[self.os_order_remaining]
+                    self.forecast_qty = os_detail[self.os_forecast]
+                    fs_detail = self.fs_map[self.forecast_qty]
+                    self.forecast_consumed = fs_detail[self.fs_forecast_consumed]
+                    self.forecast_remaining = fs_detail[self.fs_forecast_remaining]
+                    self.in_forecasts[self.forecast_qty].fillna(0, inplace=True)
+                    self.empty_forecast_indices = {}
+                    self.pegging_recorder.discard_segment()
+                    self.run_netting(order_stream, _excludeOrderMeasure=self.EXCLUDE_NETTING)
+                    self.orders_seen.add(self.order_consumed)
+                    self.orders_seen.add(self.order_remaining)
+                    self.forecasts_seen.add(self.forecast_consumed)
+
+                    if self.pegging_flag:
+                        self.append_to_final_pegging()
 
         self.in_orders[self.order_consumed_by_all_forecast] = (
                 self.in_orders[self.order_qty]
@@ -2051,6 +3396,116 @@ class DemandNetting:
             self.remaining_order_after_forecast,
         ] = 0
 
+    def get_order_type_positions(self) -> dict:
+        """Row positions (in netting sequence) of the orders with a quantity, per Order Type."""
+        eligible = self.in_orders[self.order_qty].values > 0
+        eligible = eligible & ~(self.in_orders[self.EXCLUDE_NETTING].to_numpy().astype(bool))
+        positions = flatnonzero(eligible)
+        typeCodes, orderTypes = factorize(self.in_orders[self.order_type].to_numpy()[positions])
+        positions = positions[typeCodes.argsort(kind="stable")]
+        offsets = concatenate(
+            [[0], bincount(typeCodes[typeCodes >= 0], minlength=len(orderTypes)).cumsum()]
+        )
+        positions = positions[len(typeCodes) - offsets[-1]:]
+        return {
+            orderType: positions[offsets[code]: offsets[code + 1]]
+            for code, orderType in enumerate(orderTypes)
+        }
+
+    def net_order_streams(self):
+        """
+        Multistream forecast passes. The orders of every Order Type are located once and each pass only
+        reads and updates its own orders: the remaining quantity per order stream and the quantity taken
+        per forecast stream are rows of streams x orders arrays, written to in_orders after the last pass.
+        """
+        typePositions = self.get_order_type_positions()
+        orderLabels = self.in_orders.index
+        orderStreams = list(self.os_map.keys())
+        forecastStreams = list(self.fs_map.keys())
+        remainingAfterForecast = self.in_orders[self.remaining_order_after_forecast].to_numpy(
+            dtype=float, copy=True
+        )
+        streamRemaining = empty((len(orderStreams), len(self.in_orders)), dtype=float)
+        streamTaken = zeros((len(forecastStreams), len(self.in_orders)), dtype=float)
+        forecastRemaining = {}
+        for streamPos, order_stream in enumerate(orderStreams):
+            # An order stream starts from what the earlier streams left.
+            streamRemaining[streamPos] = remainingAfterForecast
+            positions = typePositions.get(order_stream, empty(0, dtype=int64))
+            for os_detail in self.os_map[order_stream]:
+                if order_stream not in self.past_order_hash:
+                    self.past_order_hash[order_stream] = os_detail[self.os_past_order_dt]
+                self.order_consumed = os_detail[self.os_order_consumed]
+                self.order_remaining = os_detail[self.os_order_remaining]
+                self.forecast_qty = os_detail[self.os_forecast]
+                fs_detail = self.fs_map[self.forecast_qty]
+                self.forecast_consumed = fs_detail[self.fs_forecast_consumed]
+                self.forecast_remaining = fs_detail[self.fs_forecast_remaining]
+                self.in_forecasts[self.forecast_qty].fillna(0, inplace=True)
+                self.empty_forecast_indices = {}
+                self.pegging_recorder.discard_segment()
+                if self.forecast_qty not in forecastRemaining:
+                    forecastRemaining[self.forecast_qty] = self.in_forecasts[
+                        self.forecast_remaining
+                    ].to_numpy(dtype=float, copy=True)
+                forecastQty = forecastRemaining[self.forecast_qty]
+                orderQty = streamRemaining[streamPos, positions]
+                self.plugin_log(
+                    f"Run Netting For ({self.order_qty}"
+                    f": {len(positions)} "
+                    f":: {self.forecast_qty}: {(self.in_forecasts[self.forecast_qty].values > 0).sum()})"
+                )
+                if self.use_array_kernel:
+                    netted = orderQty.copy()
+                    self.net_order_positions(
+                        netted,
+                        forecastQty,
+                        arange(len(positions)),
+                        self.get_order_candidates(positions),
+                        positions,
+                    )
+                else:
+                    self.orderQtyHash = dict(zip(orderLabels[positions], orderQty.tolist()))
+                    self.forecastQtyHash = dict(enumerate(forecastQty.tolist()))
+                    if len(positions) > 0:
+                        self.in_orders.take(positions).apply(
+                            lambda _x: self.process_order(
+                                _x.to_dict(), _x.name, self.EXCLUDE_NETTING
+                            ),
+                            axis=1,
+                        )
+                    netted = array(list(self.orderQtyHash.values()), dtype=float)
+                    forecastQty[:] = list(self.forecastQtyHash.values())
+                streamRemaining[streamPos, positions] = netted
+                remainingAfterForecast[positions] = netted
+                streamTaken[forecastStreams.index(self.forecast_qty), positions] += orderQty - netted
+                self.orders_seen.add(self.order_consumed)
+                self.orders_seen.add(self.order_remaining)
+                self.forecasts_seen.add(self.forecast_consumed)
+
+                if self.pegging_flag:
+                    self.append_to_final_pegging()
+
+        orderQty = self.in_orders[self.order_qty].to_numpy()
+        for streamPos, order_stream in enumerate(orderStreams):
+            for os_detail in self.os_map[order_stream]:
+                self.in_orders[os_detail[self.os_order_remaining]] = streamRemaining[streamPos]
+                self.in_orders[os_detail[self.os_order_consumed]] = (
+                        orderQty - streamRemaining[streamPos]
+                )
+        for streamPos, forecast_stream in enumerate(forecastStreams):
+            fs_detail = self.fs_map[forecast_stream]
+            self.in_orders[fs_detail[self.fs_forecast_consumed]] = streamTaken[streamPos]
+            if forecast_stream in forecastRemaining:
+                self.in_forecasts[fs_detail[self.fs_forecast_remaining]] = forecastRemaining[
+                    forecast_stream
+                ]
+                self.in_forecasts[fs_detail[self.fs_forecast_consumed]] = (
+                        self.in_forecasts[forecast_stream].values
+                        - forecastRemaining[forecast_stream]
+                )
+        self.in_orders[self.remaining_order_after_forecast] = remainingAfterForecast
+
     def populate_order_stream_hash(self, order_stream_param):
         order_stream = order_stream_param[self.os_stream]
         forecast_stream = order_stream_param[self.os_forecast]
@@ -2100,8 +3555,11 @@ class DemandNetting:
         forecast_stream_without_space = forecast_stream.replace(" ", "")
         consumedForecast = f"consumed_{forecast_stream_without_space}"
         remainingForecast = f"remaining_{forecast_stream_without_space}"
+        forecast_demand_id = forecast_stream_param[self.fs_demand_id]
+        if self.encoder is not None:
+            forecast_demand_id = self.encoder.encode_value("Demand", forecast_demand_id)
         self.fs_map[forecast_stream] = {
-            self.fs_demand_id: forecast_stream_param[self.fs_demand_id],
+            self.fs_demand_id: forecast_demand_id,
             self.fs_is_rtf: forecast_stream_param[self.fs_is_rtf],
             self.fs_com_forecast: forecast_stream_param[self.fs_com_forecast],
             self.fs_new_forecast: forecast_stream_param[self.fs_new_forecast],
@@ -2119,6 +3577,9 @@ class DemandNetting:
         Add NettedForecastQuantityOutput and ConsumedForecastQuantityOutput to forecast data.
         Iterate over order data to call processOrder Function
         """
+        if self.use_array_kernel:
+            self.run_array_netting(_os, _excludeOrderMeasure)
+            return
         # print(">> run net")
         if self.order_remaining not in self.in_orders.columns:
             self.orderQtyHash = self.in_orders[self.remaining_order_after_forecast].to_dict()
@@ -2175,62 +3636,470 @@ class DemandNetting:
                 - self.in_forecasts[self.forecast_remaining].values
         )
 
-    def run_netting_for_rtf(self, _os=None, _excludeOrderMeasure=None):
+    def run_array_netting(self, _os=None, _excludeOrderMeasure=None, _isRTF=False):
         """
-        mainFunction: Starting Function.
-        Add OrderQuantityNotCoveredByForecast and OrderQuantityCoveredByForecast to order data.
-        Add NettedForecastQuantityOutput and ConsumedForecastQuantityOutput to forecast data.
-        Iterate over order data to call processOrder Function
+        Array backed replacement for the apply/process_order loop of run_netting, and the RTF netting.
+        Quantities are held in float arrays indexed by row position, every order is netted against a
+        precomputed array of candidate forecast positions and the results are written back once.
+        Forecast (and RTF) frames are reset to a RangeIndex before their lookups are built, so the
+        values of forecastToIndexMap are row positions.
         """
-        # print(">> run net")
-        if self.order_remaining not in self.in_orders.columns:
-            self.orderQtyHash = self.in_orders[self.order_qty].to_dict()
+        if self.order_remaining in self.in_orders.columns:
+            orderQty = self.in_orders[self.order_remaining].to_numpy(dtype=float, copy=True)
+        elif _isRTF:
+            orderQty = self.in_orders[self.order_qty].to_numpy(dtype=float, copy=True)
         else:
-            self.orderQtyHash = self.in_orders[self.order_remaining].to_dict()
+            orderQty = self.in_orders[self.remaining_order_after_forecast].to_numpy(dtype=float, copy=True)
+            self.in_orders[self.order_remaining] = self.in_orders[self.remaining_order_after_forecast]
+            self.in_orders[self.order_consumed] = 0
         if self.forecast_remaining not in self.in_forecasts.columns:
-            self.forecastQtyHash = self.in_forecasts[self.forecast_qty].to_dict()
+            forecastQty = self.in_forecasts[self.forecast_qty].to_numpy(dtype=float, copy=True)
         else:
-            self.forecastQtyHash = self.in_forecasts[self.forecast_remaining].to_dict()
+            forecastQty = self.in_forecasts[self.forecast_remaining].to_numpy(dtype=float, copy=True)
 
-        # PROCESS ORDER.
+        orderMask = self.in_orders[self.order_qty].values > 0
         if _os is not None:
-            self.plugin_log(
-                f"Run Netting For ({self.order_qty}"
-                f": {len(self.in_orders[(self.in_orders[self.order_qty].values > 0) & (self.in_orders[self.order_type] == _os)])} "
-                f":: {self.forecast_qty}: {len(self.in_forecasts[self.in_forecasts[self.forecast_qty].values > 0])})"
+            orderMask = orderMask & (self.in_orders[self.order_type].values == _os)
+        self.plugin_log(
+            f"Run Netting For ({self.order_qty}"
+            f": {orderMask.sum()} "
+            f":: {self.forecast_qty}: {(self.in_forecasts[self.forecast_qty].values > 0).sum()})"
+        )
+        if _excludeOrderMeasure is not None:
+            orderMask = orderMask & ~(
+                self.in_orders[_excludeOrderMeasure].to_numpy().astype(bool)
             )
-            self.in_orders[
-                (self.in_orders[self.order_qty].values > 0)
-                & (self.in_orders[self.order_type] == _os)
-                ].apply(
-                lambda _x: self.process_order(
-                    _x.to_dict(), _x.name, _excludeOrderMeasure
-                ),
-                axis=1,
+        orderPositions = flatnonzero(orderMask)
+
+        self.net_order_positions(
+            orderQty, forecastQty, orderPositions, self.get_order_candidates(orderPositions)
+        )
+
+        if _isRTF:
+            self.in_orders[self.order_remaining] = orderQty
+            self.in_forecasts[self.forecast_remaining] = forecastQty
+            self.in_orders[self.order_consumed] = (
+                    self.in_orders[self.order_qty].values
+                    - self.in_orders[self.order_remaining].values
             )
         else:
-            self.plugin_log(
-                f"Run Netting For ({self.order_qty}"
-                f": {len(self.in_orders[(self.in_orders[self.order_qty].values > 0)])} "
-                f":: {self.forecast_qty}: {len(self.in_forecasts[self.in_forecasts[self.forecast_qty].values > 0])})"
+            if self.use_multi_stream:
+                self.in_orders[self.forecast_consumed] = self.in_orders[self.forecast_consumed] + (
+                        self.in_orders[self.order_remaining].values - orderQty
+                )
+            self.in_orders[self.remaining_order_after_forecast] = orderQty
+            self.in_orders[self.order_consumed] = (
+                    self.in_orders[self.order_qty] - self.in_orders[self.remaining_order_after_forecast])
+            self.in_orders[self.order_remaining] = orderQty
+            self.in_forecasts[self.forecast_remaining] = forecastQty
+        self.in_forecasts[self.forecast_consumed] = (
+                self.in_forecasts[self.forecast_qty].values
+                - self.in_forecasts[self.forecast_remaining].values
+        )
+
+    def net_order_positions(
+            self, _orderQty, _forecastQty, _orderPositions, _candidates, _orderRows=None
+    ):
+        """
+        Net the orders at _orderPositions of _orderQty with the configured kernel and record their pegging.
+        _orderRows maps the positions to in_orders rows when _orderQty only holds some of the orders.
+        """
+        pegging = [] if self.pegging_flag else None
+        if self.netting_state is not None:
+            self.net_with_state(_orderQty, _forecastQty, _orderPositions, _candidates, pegging)
+        else:
+            settled, settledPegging = self.settle_single_forecast_orders(
+                _orderQty, _forecastQty, _orderPositions, _candidates, self.pegging_flag
             )
-            self.in_orders[(self.in_orders[self.order_qty].values > 0)].apply(
-                lambda _x: self.process_order(
-                    _x.to_dict(), _x.name, _excludeOrderMeasure
-                ),
-                axis=1,
+            orderPositions = _orderPositions
+            candidates = _candidates
+            if settled is not None:
+                remaining = flatnonzero(~settled)
+                orderPositions = _orderPositions[remaining]
+                candidates = [_candidates[sequence] for sequence in remaining.tolist()]
+            if self.netting_workers > 1:
+                self.net_partitioned(_orderQty, _forecastQty, orderPositions, candidates, pegging)
+            else:
+                self.net_arrays(_orderQty, _forecastQty, orderPositions, candidates, pegging)
+            if settledPegging:
+                # Back in order sequence, the pegging of an order stays in consumption order.
+                orderSequence = empty(len(_orderQty), dtype=int64)
+                orderSequence[_orderPositions] = arange(len(_orderPositions))
+                orderSequence = orderSequence.tolist()
+                pegging = sorted(settledPegging + pegging, key=lambda _x: orderSequence[_x[0]])
+        if self.pegging_flag and pegging:
+            orderPositions, forecastPositions, consumed = zip(*pegging)
+            if _orderRows is not None:
+                orderPositions = _orderRows[list(orderPositions)]
+            step = self.pegging_flush_rows or len(consumed)
+            for start in range(0, len(consumed), step):
+                self.pegging_recorder.record_positions(
+                    orderPositions[start: start + step],
+                    forecastPositions[start: start + step],
+                    consumed[start: start + step],
+                )
+                if self.pegging_recorder.size >= self.pegging_flush_rows > 0:
+                    self.flush_open_pegging()
+
+    def get_order_candidates(self, _orderPositions) -> list:
+        """
+        Candidate forecast positions of the given orders, in consumption order.
+        Orders sharing a consumption key share one array cached with the consumption tuples of the key,
+        the cached arrays are dropped whenever the forecast lookup is rebuilt.
+        """
+        if len(_orderPositions) == 0:
+            return []
+        backward = self.in_orders[self.BACKWARD_BUCKETS].to_numpy()[_orderPositions]
+        forward = self.in_orders[self.FORWARD_BUCKETS].to_numpy()[_orderPositions]
+        fItem = self.in_orders[self.f_item].to_numpy()[_orderPositions]
+        fLoc = self.in_orders[self.f_location].to_numpy()[_orderPositions]
+        fSales = self.in_orders[self.f_customer].to_numpy()[_orderPositions]
+        fTime = self.in_orders[self.f_time].to_numpy()[_orderPositions]
+        if self.use_order_forecast_map:
+            keys = zip(fItem, fLoc, fSales, fTime, backward, forward)
+        else:
+            isForecast = self.in_orders[self.DEMAND_ID].isin(self.default_demand_ids).values[
+                _orderPositions
+            ]
+            keys = zip(
+                where(isForecast, fItem, self.in_orders[self.ITEM].to_numpy()[_orderPositions]),
+                where(isForecast, fLoc, self.in_orders[self.LOCATION].to_numpy()[_orderPositions]),
+                where(isForecast, fSales, self.in_orders[self.CUSTOMER].to_numpy()[_orderPositions]),
+                where(isForecast, fTime, self.in_orders[self.TIME].to_numpy()[_orderPositions]),
+                backward,
+                forward,
             )
+        result = []
+        for oItem, oLoc, oSales, oTime, oBackward, oForward in keys:
+            key = (oItem, oLoc, oSales, oTime, int(oBackward), int(oForward))
+            candidates = self.order_consumption_tuples.get_candidates(key)
+            if candidates is None:
+                candidates = array(self.resolve_candidates(key), dtype=int64)
+                self.order_consumption_tuples.add_candidates(key, candidates)
+            result.append(candidates)
+        return result
 
-        self.in_orders[self.order_remaining] = Series(self.orderQtyHash)
-        self.in_forecasts[self.forecast_remaining] = Series(self.forecastQtyHash)
-        self.in_orders[self.order_consumed] = (
-                self.in_orders[self.order_qty].values
-                - self.in_orders[self.order_remaining].values
+    def resolve_candidates(self, _key) -> list:
+        """
+        Forecast positions an order with the given consumption key can consume, in consumption order.
+        All tuples of the key are walked, which is why lazy tuples are turned off with the array kernel.
+        """
+        forecastIndices = []
+        if not self.use_order_forecast_map:
+            for data in self.get_consumption_tuples(_key, []):
+                forecastIndex = self.forecastToIndexMap.get(data[0:3], {}).get(data[3], None)
+                if forecastIndex is not None:
+                    forecastIndices.append(forecastIndex)
+            return forecastIndices
+        return self.get_graph_candidates(_key)
+
+    @staticmethod
+    def net_arrays(_orderQty, _forecastQty, _orderPositions, _candidates, _pegging=None):
+        """
+        Greedy netting kernel.
+        Orders are visited in the sequence of _orderPositions and each one consumes from its candidate
+        forecast positions, in order, until it is filled. _orderQty and _forecastQty are updated in place
+        and every consumption is appended to _pegging as (order position, forecast position, quantity).
+        The loop itself runs over list copies of the arrays, which CPython indexes a lot faster than
+        ndarray elements, and uses the same float operations as consume_from_forecast_index.
+        """
+        orderQty = _orderQty.tolist()
+        forecastQty = _forecastQty.tolist()
+        for orderPos, candidates in zip(_orderPositions.tolist(), _candidates):
+            pending = orderQty[orderPos]
+            if not pending > 0:
+                continue
+            for forecastPos in candidates.tolist():
+                available = forecastQty[forecastPos]
+                if available > 0:
+                    consume = min(pending, available)
+                    pending -= consume
+                    forecastQty[forecastPos] = available - consume
+                    if _pegging is not None:
+                        _pegging.append((orderPos, forecastPos, consume))
+                    if pending == 0:
+                        break
+            orderQty[orderPos] = pending
+        _orderQty[:] = orderQty
+        _forecastQty[:] = forecastQty
+
+    @staticmethod
+    def settle_single_forecast_orders(
+            _orderQty, _forecastQty, _orderPositions, _candidates, _withPegging=False
+    ):
+        """
+        Orders whose only candidate is a forecast no order with more candidates can consume. For such a
+        forecast the greedy kernel reduces to: every order in sequence takes
+        min(order, max(forecast - orders before, 0)). This is computed with cumulative sums and applied in
+        place, only when the quantities are whole and small enough for float64 so the sums are as exact
+        as the kernel's subtractions. Returns the mask of settled orders (orders without candidates
+        included, None when nothing is settled) and the pegging of the settled orders.
+        """
+        candidateCounts = array([len(candidates) for candidates in _candidates], dtype=int64)
+        single = flatnonzero(candidateCounts == 1)
+        if len(single) == 0:
+            return None, []
+        multiple = flatnonzero(candidateCounts > 1)
+        shared = zeros(len(_forecastQty), dtype=bool)
+        if len(multiple) > 0:
+            shared[concatenate([_candidates[sequence] for sequence in multiple.tolist()])] = True
+        forecasts = concatenate([_candidates[sequence] for sequence in single.tolist()])
+        single = single[~shared[forecasts]]
+        forecasts = forecasts[~shared[forecasts]]
+        if len(single) == 0:
+            return None, []
+        orders = _orderPositions[single]
+        # The kernel skips orders and forecasts without a positive quantity.
+        orderQty = _orderQty[orders]
+        orderQty = where(orderQty > 0, orderQty, 0)
+        forecastQty = _forecastQty[forecasts]
+        forecastQty = where(forecastQty > 0, forecastQty, 0)
+        quantities = concatenate([orderQty, forecastQty])
+        if not (
+                isfinite(quantities).all()
+                and (quantities == floor(quantities)).all()
+                and quantities.sum() < 2 ** 53
+        ):
+            return None, []
+        sequence = forecasts.argsort(kind="stable")
+        sortedForecasts = forecasts[sequence]
+        sortedQty = orderQty[sequence]
+        # Order quantity of the forecast before every order.
+        before = sortedQty.cumsum() - sortedQty
+        forecastStart = concatenate([[True], sortedForecasts[1:] != sortedForecasts[:-1]])
+        before -= before[maximum.accumulate(where(forecastStart, arange(len(sequence)), 0))]
+        consume = empty(len(sequence), dtype=float)
+        consume[sequence] = minimum(sortedQty, maximum(forecastQty[sequence] - before, 0))
+        _orderQty[orders] -= consume
+        _forecastQty -= bincount(forecasts, consume, minlength=len(_forecastQty))
+        settled = candidateCounts == 0
+        settled[single] = True
+        pegging = []
+        if _withPegging:
+            consumed = consume > 0
+            pegging = list(
+                zip(
+                    orders[consumed].tolist(),
+                    forecasts[consumed].tolist(),
+                    consume[consumed].tolist(),
+                )
+            )
+        return settled, pegging
+
+    @staticmethod
+    def net_partition(_args):
+        orderQty, forecastQty, orderPositions, candidates, withPegging = _args
+        pegging = [] if withPegging else None
+        DemandNetting.net_arrays(orderQty, forecastQty, orderPositions, candidates, pegging)
+        return orderQty, forecastQty, pegging
+
+    @staticmethod
+    def find_components(_forecastCount, _candidates):
+        """
+        Connected components of the order to forecast eligibility graph.
+        Returns the component of every order (-1 for orders without candidates, which can not consume
+        anything) and the number of candidates per component.
+        """
+        parent = list(range(_forecastCount))
+
+        def find(_forecastPos):
+            while parent[_forecastPos] != _forecastPos:
+                parent[_forecastPos] = parent[parent[_forecastPos]]
+                _forecastPos = parent[_forecastPos]
+            return _forecastPos
+
+        firstCandidates = []
+        for candidates in _candidates:
+            candidates = candidates.tolist()
+            if not candidates:
+                firstCandidates.append(-1)
+                continue
+            root = find(candidates[0])
+            for forecastPos in candidates[1:]:
+                other = find(forecastPos)
+                if other != root:
+                    parent[other] = root
+            firstCandidates.append(candidates[0])
+
+        componentWork = defaultdict(int)
+        orderComponents = []
+        for firstCandidate, candidates in zip(firstCandidates, _candidates):
+            if firstCandidate < 0:
+                orderComponents.append(-1)
+                continue
+            component = find(firstCandidate)
+            orderComponents.append(component)
+            componentWork[component] += len(candidates)
+        return array(orderComponents, dtype=int64), componentWork
+
+    def partition_candidates(self, _forecastCount, _candidates) -> list:
+        """
+        Components of the eligibility graph packed largest first into at most netting_workers
+        partitions. Returns per partition the sorted sequence numbers of its orders.
+        """
+        orderComponents, componentWork = self.find_components(_forecastCount, _candidates)
+        partitionCount = min(self.netting_workers, len(componentWork))
+        if partitionCount == 0:
+            return []
+        partitionLoads = [(0, partition) for partition in range(partitionCount)]
+        heapify(partitionLoads)
+        componentPartition = {}
+        for component, work in sorted(
+                componentWork.items(), key=lambda _x: (-_x[1], _x[0])
+        ):
+            load, partition = partitionLoads[0]
+            componentPartition[component] = partition
+            heapreplace(partitionLoads, (load + work, partition))
+        orderPartitions = array(
+            [componentPartition.get(component, -1) for component in orderComponents.tolist()],
+            dtype=int64,
         )
-        self.in_forecasts[self.forecast_consumed] = (
-                self.in_forecasts[self.forecast_qty].values
-                - self.in_forecasts[self.forecast_remaining].values
+        return [
+            flatnonzero(orderPartitions == partition)
+            for partition in range(partitionCount)
+        ]
+
+    def net_partitioned(self, _orderQty, _forecastQty, _orderPositions, _candidates, _pegging=None):
+        """
+        net_arrays over independent partitions in a process pool.
+        Orders of different partitions never share a candidate forecast, so netting each partition
+        on its own visits every forecast in the same sequence as a serial run. Pegging is merged back
+        in order sequence.
+        """
+        partitions = self.partition_candidates(len(_forecastQty), _candidates)
+        if len(partitions) < 2:
+            self.net_arrays(_orderQty, _forecastQty, _orderPositions, _candidates, _pegging)
+            return
+        tasks = []
+        for orderSequence in partitions:
+            candidates = [_candidates[sequence] for sequence in orderSequence.tolist()]
+            forecasts = unique(concatenate(candidates))
+            orders = _orderPositions[orderSequence]
+            tasks.append(
+                (
+                    orderSequence,
+                    orders,
+                    forecasts,
+                    (
+                        _orderQty[orders],
+                        _forecastQty[forecasts],
+                        arange(len(orders)),
+                        [forecasts.searchsorted(candidate) for candidate in candidates],
+                        _pegging is not None,
+                    ),
+                )
+            )
+        self.plugin_log(
+            f"Netting {len(_orderPositions)} orders in {len(tasks)} partitions "
+            f"(sizes: {[len(task[1]) for task in tasks]})."
         )
+        with ProcessPoolExecutor(max_workers=len(tasks)) as executor:
+            results = list(
+                executor.map(DemandNetting.net_partition, [task[3] for task in tasks])
+            )
+        pegging = []
+        for (orderSequence, orders, forecasts, _), (orderQty, forecastQty, partitionPegging) in zip(
+                tasks, results
+        ):
+            _orderQty[orders] = orderQty
+            _forecastQty[forecasts] = forecastQty
+            if _pegging is not None:
+                orderSequence = orderSequence.tolist()
+                orders = orders.tolist()
+                forecasts = forecasts.tolist()
+                pegging += [
+                    (orderSequence[orderPos], orders[orderPos], forecasts[forecastPos], consume)
+                    for orderPos, forecastPos, consume in partitionPegging
+                ]
+        if _pegging is not None:
+            pegging.sort(key=lambda _x: _x[0])
+            _pegging.extend(peg[1:] for peg in pegging)
+
+    def net_with_state(self, _orderQty, _forecastQty, _orderPositions, _candidates, _pegging=None):
+        """
+        net_arrays per component, reusing the results of components netted by a previous run.
+        The outcome of a component only depends on its order and forecast quantities and candidates,
+        which are digested into the key of its stored result together with the pegging setting, so a
+        result recorded without pegging is not reused by a run with pegging. Components without a stored result are
+        netted together, and their results are recorded for the next run. Candidates are still resolved
+        for every order before this is called, so a reused component saves the kernel work only.
+        """
+        orderComponents, _ = self.find_components(len(_forecastQty), _candidates)
+        sequenceOrder = orderComponents.argsort(kind="stable")
+        components, starts = unique(orderComponents[sequenceOrder], return_index=True)
+        ends = list(starts[1:]) + [len(sequenceOrder)]
+        pegging = []
+        pending = []
+        for component, start, end in zip(components.tolist(), starts.tolist(), ends):
+            if component < 0:
+                continue
+            orderSequence = sequenceOrder[start:end]
+            orders = _orderPositions[orderSequence]
+            candidates = [_candidates[sequence] for sequence in orderSequence.tolist()]
+            forecasts = unique(concatenate(candidates))
+            localCandidates = [forecasts.searchsorted(candidate) for candidate in candidates]
+            key = NettingState.digest(
+                _orderQty[orders],
+                _forecastQty[forecasts],
+                localCandidates,
+                self.pegging_granularity if _pegging is not None else "",
+            )
+            result = self.netting_state.lookup(key)
+            if result is None:
+                pending.append((key, orderSequence, orders, forecasts, candidates))
+                continue
+            orderQty, forecastQty, componentPegging = result
+            _orderQty[orders] = orderQty
+            _forecastQty[forecasts] = forecastQty
+            if _pegging is not None:
+                orderSequence = orderSequence.tolist()
+                orders = orders.tolist()
+                forecasts = forecasts.tolist()
+                pegging += [
+                    (orderSequence[orderPos], orders[orderPos], forecasts[forecastPos], consume)
+                    for orderPos, forecastPos, consume in componentPegging
+                ]
+        self.plugin_log(
+            f"Netting State: {int((components >= 0).sum()) - len(pending)} components reused, "
+            f"{len(pending)} netted."
+        )
+        if pending:
+            pendingSequence = concatenate([component[1] for component in pending])
+            pendingSequence.sort()
+            pendingPegging = [] if _pegging is not None else None
+            pendingArgs = (
+                _orderQty,
+                _forecastQty,
+                _orderPositions[pendingSequence],
+                [_candidates[sequence] for sequence in pendingSequence.tolist()],
+                pendingPegging,
+            )
+            if self.netting_workers > 1:
+                self.net_partitioned(*pendingArgs)
+            else:
+                self.net_arrays(*pendingArgs)
+            orderSequenceOf = dict(
+                zip(_orderPositions[pendingSequence].tolist(), pendingSequence.tolist())
+            )
+            componentPegging = defaultdict(list)
+            componentOf = {}
+            for index, (key, orderSequence, orders, forecasts, candidates) in enumerate(pending):
+                for localPos, orderPos in enumerate(orders.tolist()):
+                    componentOf[orderPos] = (index, localPos)
+            for orderPos, forecastPos, consume in pendingPegging or []:
+                index, localPos = componentOf[orderPos]
+                componentPegging[index].append(
+                    (localPos, int(pending[index][3].searchsorted(forecastPos)), consume)
+                )
+                pegging.append((orderSequenceOf[orderPos], orderPos, forecastPos, consume))
+            for index, (key, orderSequence, orders, forecasts, candidates) in enumerate(pending):
+                self.netting_state.record(
+                    key,
+                    (_orderQty[orders], _forecastQty[forecasts], componentPegging[index]),
+                )
+        if _pegging is not None:
+            pegging.sort(key=lambda _x: _x[0])
+            _pegging.extend(peg[1:] for peg in pegging)
 
     def process_order(self, _orderData, _orderIndex, _excludeOrder=None):
         if _excludeOrder is not None and _orderData[_excludeOrder]:
@@ -2252,60 +4121,23 @@ class DemandNetting:
         # print("oItem", oItem)
         # print((oItem, oLoc, oSales, oTime, backward, forward))
         if not self.use_order_forecast_map:
-            consumableTuples = self.order_consumption_tuples.get(
+            consumableTuples = self.get_consumption_tuples(
                 (oItem, oLoc, oSales, oTime, backward, forward), None
             )
 
             if consumableTuples is not None:
                 self.consume_from_tuples(consumableTuples, _orderIndex)
         else:
-            fTime = _orderData[self.f_time]
-            forecastIndices = []
-            for associatedForecast in self.order_forecast_map_hash.get(
-                    (
-                            _orderData[self.f_item],
-                            _orderData[self.f_location],
-                            _orderData[self.f_customer],
-                    ),
-                    [],
-            ):
-                try:
-                    tmp = self.forecastToIndexMap[
-                        (
-                            associatedForecast[0],
-                            associatedForecast[1],
-                            associatedForecast[2],
-                        )
-                    ][fTime]
-                    forecastIndices.append(tmp)
-                except KeyError:
-                    pass
-                if backward > 0:
-                    for backTime in self.get_backward_time(fTime, backward):
-                        try:
-                            tmp = self.forecastToIndexMap[
-                                (
-                                    associatedForecast[0],
-                                    associatedForecast[1],
-                                    associatedForecast[2],
-                                )
-                            ][backTime]
-                            forecastIndices.append(tmp)
-                        except KeyError:
-                            pass
-                if forward > 0:
-                    for forTime in self.get_forward_time(fTime, forward):
-                        try:
-                            tmp = self.forecastToIndexMap[
-                                (
-                                    associatedForecast[0],
-                                    associatedForecast[1],
-                                    associatedForecast[2],
-                                )
-                            ][forTime]
-                            forecastIndices.append(tmp)
-                        except KeyError:
-                            pass
+            forecastIndices = self.get_graph_candidates(
+                (
+                    _orderData[self.f_item],
+                    _orderData[self.f_location],
+                    _orderData[self.f_customer],
+                    _orderData[self.f_time],
+                    backward,
+                    forward,
+                )
+            ).tolist()
             if self.pegging_flag:
                 self.consume_from_forecast_index_with_pegging(
                     _orderIndex, forecastIndices
@@ -2386,13 +4218,9 @@ class DemandNetting:
                 curForecastAvailable -= consume
                 self.orderQtyHash[_orderIndex] = curOrderQtyPending
                 self.forecastQtyHash[forecastIn] = curForecastAvailable
-                self.pegging.append(
-                    {
-                        self.peg_forecast_index: forecastIn,
-                        self.peg_order_index: _orderIndex,
-                        self.peg_qty_consumed: consume,
-                    }
-                )
+                self.pegging_recorder.record(_orderIndex, forecastIn, consume)
+                if self.pegging_recorder.size >= self.pegging_flush_rows > 0:
+                    self.flush_open_pegging()
                 if curForecastAvailable == 0:
                     self.empty_forecast_indices[forecastIn] = 0
                 if curOrderQtyPending == 0:
@@ -2425,51 +4253,64 @@ class DemandNetting:
         final_order = final_order[final_grain]
         forecast_data_list = []
         # FORM ONE ORDER DATA BY COMBINING ORDER AND MULTIPLE NETTED FORECASTS.
+        # Forecast rows are taken by position straight into the order columns: forecast measures that
+        # play an order column are read under their own name instead of renaming a copy of the stream.
+        forecastColumns = {
+            self.FORWARD_BUCKETS: self.F_FORWARD_BUCKETS,
+            self.BACKWARD_BUCKETS: self.F_BACKWARD_BUCKETS,
+            self.UPWARD_ITEM: self.F_UPWARD_ITEM,
+            self.UPWARD_LOCATION: self.F_UPWARD_LOCATION,
+            self.UPWARD_CUSTOMER: self.F_UPWARD_CUSTOMER,
+            self.UPWARD_TIME: self.F_UPWARD_TIME,
+            self.EXCLUDE_PLANNING: self.F_EXCLUDE_PLANNING,
+        }
+        renamedForecastColumns = set(forecastColumns.values())
         for forecastName, details in self.fs_map.items():
-            rem_forecast = details[self.fs_forecast_remaining]
             if self.use_aggregate:
-                tmp_forecast = self.in_forecasts[
-                    self.in_forecasts[f"Net_{forecastName}"].values > 0
-                    ]
+                rows = flatnonzero(self.in_forecasts[f"Net_{forecastName}"].values > 0)
             else:
-                tmp_forecast = self.in_forecasts[
-                    self.in_forecasts[forecastName].values > 0
-                    ]
-            tmp_forecast.rename(
-                columns={
-                    rem_forecast: self.open_order_qty,
-                    self.F_FORWARD_BUCKETS: self.FORWARD_BUCKETS,
-                    self.F_BACKWARD_BUCKETS: self.BACKWARD_BUCKETS,
-                    self.F_UPWARD_ITEM: self.UPWARD_ITEM,
-                    self.F_UPWARD_LOCATION: self.UPWARD_LOCATION,
-                    self.F_UPWARD_CUSTOMER: self.UPWARD_CUSTOMER,
-                    self.F_UPWARD_TIME: self.UPWARD_TIME,
-                    self.F_EXCLUDE_PLANNING: self.EXCLUDE_PLANNING,
-                },
-                inplace=True,
-            )
-
-            tmp_forecast[self.DEMAND_ID] = details[self.fs_demand_id]
-            tmp_forecast[self.order_priority] = None
-            tmp_forecast[self.order_type] = None
-            tmp_forecast[self.order_consumed_by_all_forecast] = None
-            tmp_forecast[self.remaining_order_after_forecast] = None
-
+                rows = flatnonzero(self.in_forecasts[forecastName].values > 0)
+            rem_forecast = details[self.fs_forecast_remaining]
+            columns = {
+                **forecastColumns,
+                self.open_order_qty: rem_forecast,
+            }
+            constants = {
+                self.DEMAND_ID: details[self.fs_demand_id],
+                self.order_priority: None,
+                self.order_type: None,
+                self.order_consumed_by_all_forecast: None,
+                self.remaining_order_after_forecast: None,
+            }
             for _order_col in list(self.orders_seen):
-                tmp_forecast[_order_col] = None
-
+                constants[_order_col] = None
             if not details[self.fs_is_rtf]:
-                tmp_forecast[self.EXCLUDE_PLANNING] = True
+                constants[self.EXCLUDE_PLANNING] = True
+            data = {}
+            for col in final_grain:
+                if col in constants:
+                    data[col] = constants[col]
+                elif col in columns:
+                    data[col] = self.in_forecasts[columns[col]].to_numpy()[rows]
+                elif (
+                        col in self.in_forecasts.columns
+                        and col not in renamedForecastColumns
+                        and col != rem_forecast
+                ):
+                    data[col] = self.in_forecasts[col].to_numpy()[rows]
+                elif self.use_aggregate:
+                    data[col] = None
+                else:
+                    _msg = f"{col} missing in forecast Data"
+                    self.plugin_log(_msg, "warn")
+                    raise PluginException(_msg)
             if self.use_aggregate:
-                tmp_forecast[self.open_order_qty] = tmp_forecast[
-                    [self.open_order_qty, f"Plan_{forecastName}"]
-                ].min(axis=1)
-                colsInForecast = tmp_forecast.columns
-                for col in final_grain:
-                    if col not in colsInForecast:
-                        tmp_forecast[col] = None
-
-            forecast_data_list.append(tmp_forecast[final_grain])
+                # Row wise DataFrame.min skips NaN, as fmin does.
+                data[self.open_order_qty] = fmin(
+                    self.in_forecasts[rem_forecast].to_numpy(dtype=float)[rows],
+                    self.in_forecasts[f"Plan_{forecastName}"].to_numpy(dtype=float)[rows],
+                )
+            forecast_data_list.append(DataFrame(data, index=arange(len(rows))))
 
         final_order = concat([final_order] + forecast_data_list, ignore_index=True)
 
@@ -2500,60 +4341,31 @@ class DemandNetting:
         #     self.TIME = self.f_time
 
         self.forecastToIndexMap = {}
+        self.order_consumption_tuples.clear_candidates()
         self.setup_rtf()
         if self.use_order_forecast_map:
-            tmpGraph = self.in_orderForecastMapGraph[
-                self.in_orderForecastMapGraph[self.graph_rtf_association].values == 1
-                ]
-            tmpGraph.sort_values(
-                by=[
-                    self.from_item,
-                    self.from_location,
-                    self.from_customer,
-                    self.graph_priority,
-                ],
-                inplace=True,
-            )
-            self.order_forecast_map_hash = {}
-            vectorize(self.create_order_forecast_map_hash, otypes=[str])(
-                tmpGraph[self.from_item],
-                tmpGraph[self.from_location],
-                tmpGraph[self.from_customer],
-                tmpGraph[self.to_item],
-                tmpGraph[self.to_location],
-                tmpGraph[self.to_customer],
-                self.order_forecast_map_hash,
-            )
+            self.set_graph_association(self.graph_rtf_association)
         self.in_orders[self.EXCLUDE_PLANNING].fillna(value=False, inplace=True)
         self.set_order_priority(_isForecast=True)
         self.empty_forecast_indices = {}
-        self.pegging = []
+        self.pegging_recorder.discard_segment()
         self.in_forecasts = self.in_RTFs
         self.forecast_qty = self.rtf_qty
-        self.run_netting_for_rtf(_excludeOrderMeasure=self.EXCLUDE_PLANNING)
+        # The consumption tuples are shared with the forecast phase, only the candidate positions are
+        # resolved again against the RTF lookup.
         if self.use_aggregate:
-            original_order_grain = [self.ITEM, self.LOCATION, self.CUSTOMER, self.TIME]
-            self.ITEM = self.f_item
-            self.LOCATION = self.f_location
-            self.CUSTOMER = self.f_customer
-            self.TIME = self.f_time
+            # RTF pegging is keyed by the aggregate grain of the orders.
+            self.pegging_order_grain = [self.f_item, self.f_location, self.f_customer, self.f_time]
+        self.run_array_netting(_excludeOrderMeasure=self.EXCLUDE_PLANNING, _isRTF=True)
         if self.pegging_flag:
-            self.append_to_final_pegging(self.pegging)
-        if self.use_aggregate:
-            (
-                self.ITEM,
-                self.LOCATION,
-                self.CUSTOMER,
-                self.TIME,
-            ) = original_order_grain
+            self.append_to_final_pegging()
+        self.pegging_order_grain = None
 
     def setup_rtf(self):
         self.plugin_log("Cleaning RTF Data.")
         self.in_RTFs = self.in_RTFs[self.in_RTFs[self.rtf_qty].values > 0]
         # SORT FORECAST BY ITS GRAIN
-        self.in_RTFs[self.forecast_grain] = self.in_RTFs[self.forecast_grain].astype(
-            str
-        )
+        self.to_dimension_values(self.in_RTFs, self.forecast_grain)
         if self.use_aggregate:
             self.in_RTFs = self.in_RTFs.groupby(self.forecast_grain, as_index=False)[
                 self.rtf_qty
@@ -2562,69 +4374,90 @@ class DemandNetting:
         self.in_RTFs.reset_index(inplace=True, drop=True)
 
         if len(self.in_RTFs) > 0:
+            self.create_forecast_hash(self.in_RTFs, self.forecast_grain, self.forecastToIndexMap)
             if self.pegging_flag:
-                vectorize(self.create_forecast_hash_with_pegging, otypes=[str])(
-                    self.in_RTFs[self.f_item],
-                    self.in_RTFs[self.f_location],
-                    self.in_RTFs[self.f_customer],
-                    self.in_RTFs[self.f_time],
-                    self.in_RTFs.index,
-                    self.forecastToIndexMap,
-                    self.forecastIndexForPeggingMap,
-                )
-            else:
-                vectorize(self.create_forecast_hash, otypes=[str])(
-                    self.in_RTFs[self.f_item],
-                    self.in_RTFs[self.f_location],
-                    self.in_RTFs[self.f_customer],
-                    self.in_RTFs[self.f_time],
-                    self.in_RTFs.index,
-                    self.forecastToIndexMap,
-                )
-
-    def append_to_final_pegging(self, _pegging: list):
-        # print("---------------------------------------")
-        # print(self.peg_from_demand_id)
-        # print(self.peg_from_item)
-        # print(self.peg_from_location)
-        # print(self.peg_from_customer)
-        # print(self.peg_to_item)
-        # print(self.peg_to_location)
-        # print(self.peg_to_customer)
-        # print("---------------------------------------")
-        demandIDIndexHash = self.in_orders[self.DEMAND_ID].to_dict()
-        orderHash = self.in_orders.set_index(self.in_orders.index)[
+                self.set_pegging_forecast_keys(self.in_RTFs)
+
+    def append_to_final_pegging(self):
+        """Close the pegging segment of the current pass against the current order and forecast keys."""
+        if self.pegging_forecast_keys is None:
+            self.pegging_recorder.discard_segment()
+            return
+        self.close_pegging_segment()
+        if self.pegging_sink is not None:
+            self.flush_pegging_to_sink()
+
+    def flush_open_pegging(self):
+        """
+        Write the open segment of the current pass to the pegging sink before the pass ends, so the
+        recorder never holds more than Pegging Sink Chunk Rows rows. With Order Forecast granularity the
+        rows are summed per flushed part of the pass.
+        """
+        if self.pegging_forecast_keys is None:
+            self.pegging_recorder.discard_segment()
+            return
+        self.close_pegging_segment()
+        self.flush_pegging_to_sink()
+
+    def close_pegging_segment(self):
+        forecastIndex, forecastKeys = self.pegging_forecast_keys
+        orderGrain = self.pegging_order_grain or [self.ITEM, self.LOCATION, self.CUSTOMER, self.TIME]
+        self.pegging_recorder.close_segment(
+            self.in_orders.index,
+            [self.in_orders[self.DEMAND_ID].to_numpy()]
+            + [self.in_orders[column].to_numpy() for column in orderGrain],
+            forecastIndex,
+            forecastKeys,
+            self.forecast_qty,
+        )
+
+    def get_pegging_key_columns(self) -> list:
+        return [
+            self.peg_from_demand_id,
+            self.peg_from_item,
+            self.peg_from_location,
+            self.peg_from_customer,
+            self.peg_from_time,
+            self.peg_to_item,
+            self.peg_to_location,
+            self.peg_to_customer,
+            self.peg_to_time,
+        ]
+
+    def get_recorded_pegging(self) -> DataFrame:
+        return self.pegging_recorder.to_frame(
             [
-                self.ITEM,
-                self.LOCATION,
-                self.CUSTOMER,
-                self.TIME,
-            ]
-        ].to_dict()
-        for peg in _pegging:
-            fromDemandID = demandIDIndexHash.get(peg[self.peg_order_index], None)
-            self.finalPegging[self.peg_from_demand_id].append(fromDemandID)
-            self.finalPegging[self.peg_from_item].append(
-                orderHash[self.ITEM][peg[self.peg_order_index]]
-            )
-            self.finalPegging[self.peg_from_location].append(
-                orderHash[self.LOCATION][peg[self.peg_order_index]]
-            )
-            self.finalPegging[self.peg_from_customer].append(
-                orderHash[self.CUSTOMER][peg[self.peg_order_index]]
-            )
-            self.finalPegging[self.peg_from_time].append(
-                orderHash[self.TIME][peg[self.peg_order_index]]
-            )
-            pegItem, pegLoc, pegSale, pegTime = self.forecastIndexForPeggingMap.get(
-                peg[self.peg_forecast_index], (None, None, None, None)
-            )
-            self.finalPegging[self.peg_to_item].append(pegItem)
-            self.finalPegging[self.peg_to_location].append(pegLoc)
-            self.finalPegging[self.peg_to_customer].append(pegSale)
-            self.finalPegging[self.peg_to_time].append(pegTime)
-            self.finalPegging[self.peg_forecast_measure].append(self.forecast_qty)
-            self.finalPegging[self.peg_qty_consumed].append(peg[self.peg_qty_consumed])
+                self.peg_from_demand_id,
+                self.peg_from_item,
+                self.peg_from_location,
+                self.peg_from_customer,
+                self.peg_from_time,
+            ],
+            [
+                self.peg_to_item,
+                self.peg_to_location,
+                self.peg_to_customer,
+                self.peg_to_time,
+            ],
+            self.peg_forecast_measure,
+            self.peg_qty_consumed,
+        )
+
+    def flush_pegging_to_sink(self):
+        """Write the closed pegging segments as final output rows and release them from the recorder."""
+        pegging = self.get_recorded_pegging()
+        self.pegging_recorder.clear()
+        if len(pegging) == 0:
+            return
+        pegging.insert(
+            0, self.peg_seq, self.pegging_sink.sequence(pegging, self.get_pegging_key_columns())
+        )
+        pegging.insert(0, self.VERSION, self.curVersion)
+        if self.encoder is not None:
+            self.encoder.decode(pegging)
+        pegging[self.peg_from_time] = to_datetime(pegging[self.peg_from_time])
+        pegging[self.peg_to_time] = to_datetime(pegging[self.peg_to_time])
+        self.pegging_sink.write(pegging)
 
     def convert_to_telescopic(
             self, _order: DataFrame, _forecast: DataFrame
@@ -2692,7 +4525,8 @@ class DemandNetting:
         return OrderDemandTypeOutput, ForecastDemandTypeOutput
 
     def get_pegging_data(self):
-        pegging = DataFrame.from_dict(self.finalPegging)
+        # With a pegging sink the recorder has been flushed, the output stays empty.
+        pegging = self.get_recorded_pegging()
         if self.pegging_flag:
             if (
                     len(pegging) == 0
@@ -2715,17 +4549,7 @@ class DemandNetting:
                     ]
                 )
             else:
-                pegCols = [
-                    self.peg_from_demand_id,
-                    self.peg_from_item,
-                    self.peg_from_location,
-                    self.peg_from_customer,
-                    self.peg_from_time,
-                    self.peg_to_item,
-                    self.peg_to_location,
-                    self.peg_to_customer,
-                    self.peg_to_time,
-                ]
+                pegCols = self.get_pegging_key_columns()
                 pegging.insert(0, self.peg_seq, 0)
                 pegging[self.peg_seq] = pegging.groupby(by=pegCols).cumcount().add(1)
                 pegging.insert(0, self.VERSION, self.curVersion)
@@ -2866,9 +4690,7 @@ class DemandNetting:
         self.original_in_forecast = self.in_forecasts.copy(deep=True)
         self.original_in_forecast[netPlanMeasureList] = self.original_in_forecast[netPlanMeasureList].fillna(0)
         grouping_columns = [self.VERSION] + self.forecast_grain
-        self.in_forecasts[grouping_columns] = self.in_forecasts[
-            grouping_columns
-        ].astype(str)
+        self.to_dimension_values(self.in_forecasts, grouping_columns)
         self.in_forecasts = self.in_forecasts.groupby(
             by=grouping_columns,
             as_index=False,
@@ -2955,7 +4777,11 @@ class DemandNetting:
             consumedForecast = f"consumed_{forecast_stream_without_space}"
             remainingForecast = f"remaining_{forecast_stream_without_space}"
             self.fs_map[self.forecast_qty] = {
-                self.fs_demand_id: Config.FORECAST_DEMAND_ID,
+                self.fs_demand_id: (
+                    Config.FORECAST_DEMAND_ID
+                    if self.encoder is None
+                    else self.encoder.encode_value("Demand", Config.FORECAST_DEMAND_ID)
+                ),
                 self.fs_is_rtf: True,
                 self.fs_com_forecast: Config.COM_FCST,
                 self.fs_new_forecast: Config.NEW_FCST,
@@ -2966,7 +4792,7 @@ class DemandNetting:
 
     def net_order_against_agg_forecast(self):
         self.generate_stream_hash()
-        for os, os_detail in self.os_map.items():
+        for order_stream, os_detail in self.os_map.items():
             os_detail = os_detail[0]
             self.order_consumed = os_detail[self.os_order_consumed]
             self.order_remaining = os_detail[self.os_order_remaining]
@@ -2977,16 +4803,17 @@ class DemandNetting:
             self.forecast_remaining = fs_detail[self.fs_forecast_remaining]
             self.in_forecasts[self.forecast_qty].fillna(0, inplace=True)
             self.empty_forecast_indices = {}
-            self.pegging = []
+            self.pegging_recorder.discard_segment()
             self.net_order_from_native(fs_detail[self.is_base])
-            self.run_netting(os, _excludeOrderMeasure=self.EXCLUDE_NETTING)
+            self.run_netting(order_stream, _excludeOrderMeasure=self.EXCLUDE_NETTING)
             self.orders_seen.add(self.order_consumed)
             self.orders_seen.add(self.order_remaining)
             self.forecasts_seen.add(self.forecast_consumed)
             if self.pegging_flag:
-                self.append_to_final_pegging(self.pegging)
+                self.append_to_final_pegging()
 
-        self.in_orders[self.remaining_order_after_forecast] = Series(self.orderQtyHash)
+        if not self.use_array_kernel:
+            self.in_orders[self.remaining_order_after_forecast] = Series(self.orderQtyHash)
         self.in_orders[self.order_consumed_by_all_forecast] = (
                 self.in_orders[self.order_qty]
                 - self.in_orders[self.remaining_order_after_forecast]
@@ -3003,19 +4830,104 @@ class DemandNetting:
         ] = 0
 
     def net_order_from_native(self, _isBaseForecast):
-        # Get all Qty in hash form to Lookup
         if self.order_remaining not in self.in_orders.columns:
-            self.orderQtyHash = self.in_orders[self.order_qty].to_dict()
+            orderQty = self.in_orders[self.order_qty]
         else:
-            self.orderQtyHash = self.in_orders[self.order_remaining].to_dict()
+            orderQty = self.in_orders[self.order_remaining]
         if self.forecast_remaining not in self.in_forecasts.columns:
-            self.forecastQtyHash = self.in_forecasts[self.forecast_qty].to_dict()
+            forecastQty = self.in_forecasts[self.forecast_qty]
         else:
-            self.forecastQtyHash = self.in_forecasts[self.forecast_remaining].to_dict()
-        self.originalForecastQtyHash = self.original_in_forecast[
-            self.forecast_qty
-        ].to_dict()
+            forecastQty = self.in_forecasts[self.forecast_remaining]
+        originalForecastQty = self.original_in_forecast[self.forecast_qty]
+        result = self.consume_from_native_arrays(
+            orderQty.to_numpy(dtype=float, copy=True),
+            forecastQty.to_numpy(dtype=float, copy=True),
+            originalForecastQty.to_numpy(dtype=float, copy=True),
+        )
+        if result is None:
+            # Get all Qty in hash form to Lookup
+            self.orderQtyHash = orderQty.to_dict()
+            self.forecastQtyHash = forecastQty.to_dict()
+            self.originalForecastQtyHash = originalForecastQty.to_dict()
+            self.consume_from_native_loop()
+            result = (
+                Series(self.orderQtyHash),
+                Series(self.forecastQtyHash),
+                Series(self.originalForecastQtyHash),
+            )
+        orderQty, forecastQty, originalForecastQty = result
+        if _isBaseForecast & self.ConsumeOnNativeBeforeAggregation:
+            self.in_orders[self.order_remaining] = orderQty
+            self.in_forecasts[self.forecast_remaining] = forecastQty
+        else:
+            self.in_orders[self.NATIVE_CONSUME] = orderQty
+            self.in_forecasts[self.NATIVE_CONSUME] = forecastQty
+        self.original_in_forecast[self.forecast_remaining] = originalForecastQty
 
+    @staticmethod
+    def last_key_positions(_keys: list, _lookup: list):
+        """Position of the last row of _keys matching each row of _lookup (-1 when there is none)."""
+        keys = MultiIndex.from_arrays(_keys)
+        lastRows = flatnonzero(~keys.duplicated(keep="last"))
+        positions = keys[lastRows].get_indexer(MultiIndex.from_arrays(_lookup))
+        return where(positions >= 0, lastRows[positions], -1)
+
+    def consume_from_native_arrays(self, _orderQty, _forecastQty, _originalForecastQty):
+        """
+        Native consumption as a join plus grouped cumulative sums: every order takes from the native
+        forecast of its own key, in order sequence, min(order, forecast left). The running sums only match
+        the sequential subtractions of consume_from_native when they are exact, so quantities must be
+        whole, non-negative and small enough for float64; otherwise None is returned and the loop is used.
+        The updated order, forecast and native forecast quantities are returned.
+        """
+        orderKeys = [
+            self.in_orders[col].to_numpy()
+            for col in [self.ITEM, self.LOCATION, self.CUSTOMER, self.TIME]
+        ]
+        if any(isna(values).any() for values in orderKeys):
+            return None
+        originalRows = self.last_key_positions(
+            [self.original_in_forecast[col].to_numpy() for col in self.original_forecast_grain],
+            orderKeys,
+        )
+        exclude = self.in_orders[self.EXCLUDE_NETTING].to_numpy().astype(bool)
+        rows = flatnonzero(~exclude & (originalRows >= 0))
+        forecastRows = self.last_key_positions(
+            [self.in_forecasts[col].to_numpy() for col in self.forecast_grain],
+            [self.in_orders[col].to_numpy()[rows] for col in self.forecast_grain],
+        )
+        if (forecastRows < 0).any():
+            # The loop raises the KeyError.
+            return None
+        groups = originalRows[rows]
+        quantities = concatenate(
+            [_orderQty[rows], _originalForecastQty[groups], _forecastQty[forecastRows]]
+        )
+        if not (
+                isfinite(quantities).all()
+                and (quantities >= 0).all()
+                and (quantities == floor(quantities)).all()
+                and quantities.sum() < 2 ** 53
+        ):
+            return None
+        if len(rows) == 0:
+            return _orderQty, _forecastQty, _originalForecastQty
+        sequence = groups.argsort(kind="stable")
+        rows = rows[sequence]
+        groups = groups[sequence]
+        forecastRows = forecastRows[sequence]
+        orderQty = _orderQty[rows]
+        # Order quantity of the group before every order.
+        before = orderQty.cumsum() - orderQty
+        groupStart = concatenate([[True], groups[1:] != groups[:-1]])
+        before -= before[maximum.accumulate(where(groupStart, arange(len(rows)), 0))]
+        consume = minimum(orderQty, maximum(_originalForecastQty[groups] - before, 0))
+        _orderQty[rows] -= consume
+        _originalForecastQty -= bincount(groups, consume, minlength=len(_originalForecastQty))
+        _forecastQty -= bincount(forecastRows, consume, minlength=len(_forecastQty))
+        return _orderQty, _forecastQty, _originalForecastQty
+
+    def consume_from_native_loop(self):
         vectorize(self.consume_from_native, otypes=[str])(
             self.in_orders[self.ITEM],
             self.in_orders[self.LOCATION],
@@ -3028,15 +4940,6 @@ class DemandNetting:
             self.in_orders[self.EXCLUDE_NETTING],
             self.in_orders.index,
         )
-        if _isBaseForecast & self.ConsumeOnNativeBeforeAggregation:
-            self.in_orders[self.order_remaining] = Series(self.orderQtyHash)
-            self.in_forecasts[self.forecast_remaining] = Series(self.forecastQtyHash)
-        else:
-            self.in_orders[self.NATIVE_CONSUME] = Series(self.orderQtyHash)
-            self.in_forecasts[self.NATIVE_CONSUME] = Series(self.forecastQtyHash)
-        self.original_in_forecast[self.forecast_remaining] = Series(
-            self.originalForecastQtyHash
-        )
 
     def consume_from_native(
             self,
@@ -3074,12 +4977,9 @@ class DemandNetting:
             self.plugin_log("Past Order Date is Not Available", "warn")
         else:
             past_date = to_datetime(self.in_pastOrderDate[self.TIME][0])
-            self.past_orders = self.in_orders[
-                to_datetime(self.in_orders[self.TIME]) < past_date
-                ]
-            self.in_orders = self.in_orders[
-                to_datetime(self.in_orders[self.TIME]) >= past_date
-                ]
+            order_dates = to_datetime(self.decoded(self.in_orders[self.TIME]))
+            self.past_orders = self.in_orders[order_dates < past_date]
+            self.in_orders = self.in_orders[order_dates >= past_date]
 
 
 class SkipNetting:
@@ -3092,7 +4992,7 @@ class SkipNetting:
             logger,
     ):
         self.class_name: str = __name__
-        self.class_version: str = "v24.5"
+        self.class_version: str = "v24.6"
         self.in_orders: DataFrame = in_orders
         self.in_forecasts: DataFrame = in_forecasts
         self.in_forecastStreamParameters: DataFrame = in_forecastStreamParameters
@@ -3249,7 +5149,7 @@ class Profiling:
             logger,
     ):
         self.class_name: str = __name__
-        self.class_version: str = "v24.5"
+        self.class_version: str = "v24.6"
 
         self.in_netted_order = in_netted_order
         self.in_netted_forecast = in_netted_forecast
@@ -3389,9 +5289,7 @@ class Profiling:
                 self.in_basis, on=common_cols, how="inner"
             )
 
-            self.in_netted_forecast = self.in_netted_forecast.groupby(
-                by=forecast_cols, as_index=False, observed=True
-            ).apply(self.apply_norm)
+            self.in_netted_forecast = self.spread_by_basis(forecast_cols)
 
         else:
 
@@ -3610,3 +5508,109 @@ class Profiling:
         elif self.basis_spread_method == "Round Down":
             group[self.netted_demand_qty] = floor(group[self.netted_demand_qty])
         return group
+
+    def spread_by_basis(self, forecast_cols):
+        """
+        Array form of groupby(forecast_cols).apply(self.apply_norm): same rows, index and values,
+        with every per row step of apply_norm done for all groups at once. Group totals use the
+        numpy sum Series.sum uses and Distribute orders a group the way sort_values does, so the
+        result matches the loop exactly. Measures of other dtypes than the loop was written for
+        go through apply_norm.
+        """
+        forecast = self.in_netted_forecast
+        if (
+                forecast.empty
+                or forecast[self.netted_demand_qty].dtype != float64
+                or forecast[self.basis].dtype not in (float64, int64)
+        ):
+            return forecast.groupby(
+                by=forecast_cols, as_index=False, observed=True
+            ).apply(self.apply_norm)
+
+        # Rows of the groups in group order, rows with a missing key are dropped like groupby does.
+        groupNumbers = (
+            forecast.groupby(by=forecast_cols, observed=True).ngroup().to_numpy()
+        )
+        rows = flatnonzero(~isna(groupNumbers))
+        rows = rows[groupNumbers[rows].argsort(kind="stable")]
+        groups = groupNumbers[rows].astype(int64)
+        sizes = bincount(groups)
+        starts = sizes.cumsum() - sizes
+
+        basis = forecast[self.basis].to_numpy()[rows]
+        # Series.sum of a group is the numpy sum of its values with missing values as 0.
+        summed = where(isna(basis), 0, basis) if basis.dtype == float64 else basis
+        ends = starts + sizes
+        totals = array(
+            [summed[start:end].sum() for start, end in zip(starts.tolist(), ends.tolist())],
+            dtype=basis.dtype,
+        )
+        total = totals.repeat(sizes)
+        ratio = basis / total
+        quantity = forecast[self.netted_demand_qty].to_numpy()[rows]
+
+        if self.basis_spread_method == "Distribute":
+            order = self.sort_within_groups(ratio, starts, ends)
+            rows = rows[order]
+            ratio = ratio[order]
+            quantity = self.distribute(quantity[order[starts]], ratio, starts, sizes)
+            level = arange(len(rows)) - starts.repeat(sizes)
+        else:
+            quantity = quantity * ratio
+            if self.basis_spread_method == "Round Up":
+                quantity = ceil(quantity)
+            elif self.basis_spread_method == "Round Down":
+                quantity = floor(quantity)
+            level = forecast.index.to_numpy()[rows]
+
+        result = forecast.take(rows)
+        result["total"] = total
+        result["ratio"] = ratio
+        result[self.netted_demand_qty] = quantity
+        result.index = MultiIndex.from_arrays([groups, level])
+        return result
+
+    @staticmethod
+    def sort_within_groups(values, starts, ends):
+        """
+        Positions that order every group by value the way sort_values orders the group alone:
+        quicksort over the values that are not missing, missing values last in input order.
+        """
+        order = arange(len(values))
+        missing = isna(values)
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            if end - start < 2:
+                continue
+            positions = order[start:end].copy()
+            present = ~missing[start:end]
+            groupValues = values[start:end]
+            order[start:end] = concatenate(
+                [
+                    positions[present][groupValues[present].argsort(kind="quicksort")],
+                    positions[~present],
+                ]
+            )
+        return order
+
+    @staticmethod
+    def distribute(total, ratio, starts, sizes):
+        """
+        The Distribute split of apply_norm, one step per row position for all groups at once:
+        floor((total - distributed so far) * ratio / ratio of the remaining rows).
+        """
+        quantity = empty(len(ratio))
+        distributed = zeros(len(starts))
+        remainingRatio = full(len(starts), 1.0)
+        groupsBySize = (-sizes).argsort(kind="stable")
+        activeCounts = bincount(sizes, minlength=sizes.max() + 1)[::-1].cumsum()[::-1]
+        for step in range(sizes.max()):
+            active = groupsBySize[: activeCounts[step + 1]]
+            positions = starts[active] + step
+            share = floor(
+                ((total[active] - distributed[active]) * ratio[positions])
+                / remainingRatio[active]
+            )
+            quantity[positions] = share
+            distributed[active] += share
+            remainingRatio[active] -= ratio[positions]
+        return quantity
@@ -0,0 +1,94 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from demand_netting import DemandNetting
+
+VERSION = "Version.[Version Name]"
+ITEM = "Item.[Item]"
+LOCATION = "Location.[Location]"
+CUSTOMER = "Sales Domain.[Customer Group]"
+TIME = "Time.[WeekKey]"
+DEMAND_ID = "Demand.[DemandID]"
+
+
+def make_inputs(seed=0, n_items=6, n_weeks=10, n_orders=120):
+    rng = np.random.default_rng(seed)
+    items = [f"ITEM_{i:03d}" for i in range(n_items)]
+    locations = ["LOC_0", "LOC_1"]
+    customers = ["CUST_0", "CUST_1"]
+    weeks = [str(week) for week in pd.date_range("2024-01-01", periods=n_weeks, freq="W-MON")]
+    orders = pd.DataFrame(
+        {
+            VERSION: "CW",
+            ITEM: rng.choice(items, n_orders),
+            LOCATION: rng.choice(locations, n_orders),
+            CUSTOMER: rng.choice(customers, n_orders),
+            TIME: rng.choice(weeks[2:-2], n_orders),
+            DEMAND_ID: [f"D{i:05d}" for i in range(n_orders)],
+            "Order Quantity": rng.integers(1, 40, n_orders).astype(float),
+            "Order Priority": rng.integers(1, 5, n_orders).astype(float),
+            "Netting Backward Buckets Order": rng.choice([0, 1, 2], n_orders),
+            "Netting Forward Buckets Order": rng.choice([0, 1], n_orders),
+        }
+    )
+    orders["Open Order Quantity"] = orders["Order Quantity"]
+    orders["Order Due Date"] = orders[TIME]
+    orders["Netting Item Upward Levels Order"] = rng.choice([0, 1], n_orders)
+    for level in ("Location", "Sales Domain", "Time"):
+        orders[f"Netting {level} Upward Levels Order"] = 0
+    orders["Exclude from Netting Order"] = False
+    orders["Exclude from Planning Order"] = False
+    forecasts = pd.DataFrame(
+        [(item, loc, cust, week) for item in items for loc in locations for cust in customers for week in weeks],
+        columns=[ITEM, LOCATION, CUSTOMER, TIME],
+    )
+    forecasts.insert(0, VERSION, "CW")
+    forecasts["Base Forecast Quantity"] = rng.integers(0, 30, len(forecasts)).astype(float)
+    forecasts["Netting Backward Buckets Forecast"] = rng.choice([0, 1], len(forecasts))
+    forecasts["Netting Forward Buckets Forecast"] = 0
+    for level in ("Item", "Location", "Sales Domain", "Time"):
+        forecasts[f"Netting {level} Upward Levels Forecast"] = 0
+    forecasts["Exclude from Netting Forecast"] = False
+    forecasts["Exclude from Planning Forecast"] = False
+    rtfs = forecasts[[VERSION, ITEM, LOCATION, CUSTOMER, TIME]].sample(frac=0.5, random_state=seed)
+    rtfs = rtfs.reset_index(drop=True)
+    rtfs["RTF"] = rng.integers(0, 50, len(rtfs)).astype(float)
+    return dict(
+        in_orders=orders,
+        in_forecasts=forecasts,
+        in_RTFs=rtfs,
+        master_item=pd.DataFrame({"Item.[L1]": [f"L1_{i // 3}" for i in range(n_items)], ITEM: items}),
+        master_location=pd.DataFrame({"Location.[Region]": ["R_0", "R_1"], LOCATION: locations}),
+        master_salesDomain=pd.DataFrame({"Sales Domain.[Region]": ["SR_0", "SR_1"], CUSTOMER: customers}),
+        master_time=pd.DataFrame({"Time.[MonthKey]": [week[:7] for week in weeks], TIME: weeks}),
+        in_telescopic=pd.DataFrame({TIME: weeks, "Time.[PartialWeekKey]": weeks, "Time.[DayKey]": weeks}),
+        in_orderForecastMapGraph=pd.DataFrame(),
+        in_orderStreamParameters=pd.DataFrame(),
+        in_forecastStreamParameters=pd.DataFrame(),
+        in_pastOrderDate=pd.DataFrame({TIME: [weeks[4]]}),
+        in_basis=pd.DataFrame(),
+    )
+
+
+def run_netting(parameters):
+    inputs = make_inputs()
+    netting = DemandNetting(**inputs, in_parameters=parameters, logger=logging.getLogger(__name__))
+    return netting.run_demand_netting()
+
+
+def test_state_recorded_without_pegging_is_not_reused_for_pegging(tmp_path):
+    parameters = {
+        "Backward Forward Consumption Order": "BILSF",
+        "Hierarchical Consumption Order": "ILST",
+        "Netting Pegging": "1",
+    }
+    _, _, expected = run_netting(parameters)
+    assert len(expected) > 0
+
+    stateParameters = dict(parameters, **{"Netting State Directory": str(tmp_path)})
+    run_netting(dict(stateParameters, **{"Netting Pegging": "0"}))
+    _, _, pegging = run_netting(stateParameters)
+
+    assert len(pegging) == len(expected)
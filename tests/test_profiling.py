@@ -0,0 +1,50 @@
+import logging
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from demand_netting import Profiling
+
+ITEM = "Item.[Item]"
+LOCATION = "Location.[Location]"
+TIME = "Time.[DayKey]"
+QUANTITY = "Netted Quantity"
+BASIS = "Basis"
+
+
+def make_forecast(seed, kind):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for group, size in enumerate(rng.choice([1, 2, 3, 7, 9, 16, 40], 60)):
+        quantity = float(rng.integers(0, 1000))
+        for day in range(size):
+            if kind == "fractional":
+                basis = rng.random() * 10.0 ** rng.integers(-3, 6)
+            elif kind == "missing":
+                basis = np.nan if rng.random() < 0.25 else rng.random()
+            else:
+                basis = float(rng.integers(0, 3))
+            rows.append((f"I{group % 7}", f"L{group}", quantity, f"D{day}", basis))
+    forecast = pd.DataFrame(rows, columns=[ITEM, LOCATION, QUANTITY, TIME, BASIS])
+    return forecast.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+@pytest.mark.parametrize("method", ["Distribute", "Round Up", "Round Down", "Proportional"])
+@pytest.mark.parametrize("kind", ["fractional", "missing", "tied"])
+@pytest.mark.parametrize("seed", range(3))
+def test_spread_by_basis_matches_apply_norm(method, kind, seed):
+    forecast = make_forecast(seed, kind)
+    parameters = {
+        "Netting Profiling Spread method": method,
+        "Netting Profiling Basis Measure Name": BASIS,
+        "Netting Output Measure Name": QUANTITY,
+    }
+    profiling = Profiling(forecast, forecast, pd.DataFrame(), parameters, pd.DataFrame(), logging.getLogger(__name__))
+    forecastCols = [ITEM, LOCATION, QUANTITY]
+
+    expected = forecast.copy().groupby(by=forecastCols, as_index=False, observed=True).apply(profiling.apply_norm)
+    profiling.in_netted_forecast = forecast.copy()
+    result = profiling.spread_by_basis(forecastCols)
+
+    pd.testing.assert_frame_equal(result, expected, check_exact=True)